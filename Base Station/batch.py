@@ -0,0 +1,150 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Batch analysis
+#   Version:            1
+#
+#   Description:
+#       Runs the traffic, KNN and training pipelines without prompts or a display, for cron jobs
+#       and scripted runs. The node and date range come from the command line, results go to the
+#       database (and a CSV file of entries and exits for traffic), and matplotlib is only
+#       imported when a figure is asked for with --figure, which saves it to a file.
+#           python batch.py traffic --start 2017-11-15T11:00 --end 2017-11-15T12:00 --events out.csv
+#           python batch.py knn --node 1 --start 2018-09-29T19:30 --end 2018-09-29T20:00
+#           python batch.py knn --node 1 2 --incremental --every 60
+#           python batch.py training --start 2018-03-11T17:41:08 --end 2018-03-11T17:46:33
+#       Dates are anything numpy understands (2017-11-15, 2017-11-15T11:00, ...) or Datetime text,
+#       leave them out to take all measurements.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy, matplotlib (figures only)
+
+import argparse
+import csv
+import os
+import sqlite3
+import time
+import numpy as np
+import knn
+import storage
+import thermal
+
+
+def save_figure(path, plot):
+    # draw with plot(pyplot) and write the figure to path, no display needed
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib import pyplot as plt
+    plot(plt)
+    plt.gcf().autofmt_xdate()
+    plt.savefig(path)
+    plt.close()
+
+
+def traffic(args):
+    # the tracker pulls in scipy.optimize, only the traffic command needs it
+    import parallel
+    import tracking
+    conn = sqlite3.connect(args.db)
+    thresholds = {n: model.threshold(args.multiplier) for n, model in thermal.BackgroundModels.load(conn).items()}
+    blob_store = None if args.no_blobs else storage.BlobStore(conn)
+    events = []
+
+    def finished_blob(node, blob):
+        if blob.readings > 1:
+            if blob_store is not None:
+                blob_store.add(node, blob)
+            way = tracking.direction(blob)
+            if way is not None:
+                events.append((int(node), blob.start_time, way))
+
+    parallel.analyze(args.db, thresholds, args.node, args.start, args.end, args.window or parallel.WINDOW,
+                     args.processes, sink=finished_blob)
+    if blob_store is not None:
+        blob_store.flush()
+    conn.close()
+
+    for node in sorted(set(i[0] for i in events)):
+        print('node {}: {} left the area and {} entered the area'.format(
+            node, sum(1 for i in events if i[0] == node and i[2] == tracking.LEAVE),
+            sum(1 for i in events if i[0] == node and i[2] == tracking.ENTER)))
+    if args.events:
+        with open(args.events, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Node', 'Datetime', 'Direction'])
+            for node, epoch, way in sorted(events, key=lambda i: i[1]):
+                writer.writerow([node, storage.from_epoch(epoch).strftime(storage.TIME_FORMAT), way])
+    if args.figure:
+        def plot(plt):
+            for row, way in enumerate((tracking.ENTER, tracking.LEAVE), 1):
+                times = np.array([i[1] for i in events if i[2] == way], dtype=np.int64).astype('datetime64[us]')
+                plt.scatter(times, [row] * len(times), label='{} ({})'.format(way, len(times)))
+            plt.legend()
+        save_figure(args.figure, plot)
+
+
+def run_knn(args):
+    conn = sqlite3.connect(args.db)
+    while args.every:
+        # keep the KNN table current, the model and thresholds stay cached between passes
+        for node in args.node or [knn.TRAINING_NODE]:
+            epochs, guesses = knn.run_knn(conn, node, args.start, args.end, args.k, args.multiplier, True)
+            if len(guesses):
+                print('node {}: {} new frames estimated'.format(node, len(guesses)))
+        time.sleep(args.every)
+    for node in args.node or [knn.TRAINING_NODE]:
+        epochs, guesses = knn.run_knn(conn, node, args.start, args.end, args.k, args.multiplier, args.incremental)
+        print('node {}: {} frames estimated'.format(node, len(guesses)))
+        if args.figure:
+            def plot(plt):
+                plt.plot(epochs.astype('datetime64[us]'), guesses, marker='o')
+            path = args.figure
+            if len(args.node or ()) > 1:
+                path = '_node{}'.format(node).join(os.path.splitext(path))
+            save_figure(path, plot)
+    conn.close()
+
+
+def training(args):
+    conn = sqlite3.connect(args.db)
+    for node in args.node or [knn.TRAINING_NODE]:
+        added = knn.collect_training(conn, node, args.start, args.end, args.multiplier)
+        print('node {}: {} training rows added'.format(node, added))
+    conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analysis pipelines without prompts or a display')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    for name, func, multiplier in (('traffic', traffic, 5), ('knn', run_knn, knn.KNN_MULTIPLIER),
+                                   ('training', training, knn.TRAINING_MULTIPLIER)):
+        command = commands.add_parser(name)
+        command.set_defaults(func=func)
+        command.add_argument('--db', default='occupancy.db', help='occupancy database')
+        command.add_argument('--node', type=int, nargs='+', help='nodes to analyze (default: every node for '
+                                                                  'traffic, the training node otherwise)')
+        command.add_argument('--start', help='first date/time to analyze')
+        command.add_argument('--end', help='last date/time to analyze')
+        command.add_argument('--multiplier', type=float, default=multiplier,
+                             help='threshold in standard deviations above the background')
+        if name != 'training':
+            command.add_argument('--figure', help='save a plot of the results to this file')
+    commands.choices['traffic'].add_argument('--events', help='write entries and exits to this CSV file')
+    commands.choices['traffic'].add_argument('--no-blobs', action='store_true',
+                                             help="don't store the tracked blobs in the database")
+    commands.choices['traffic'].add_argument('--window', type=float,
+                                             help='seconds of data per parallel task (default: 6 hours)')
+    commands.choices['traffic'].add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    commands.choices['knn'].add_argument('--k', type=int, default=knn.K, help='neighbours per estimate')
+    commands.choices['knn'].add_argument('--incremental', action='store_true',
+                                         help='only estimate frames newer than the last incremental run')
+    commands.choices['knn'].add_argument('--every', type=float, metavar='SECONDS',
+                                         help='keep running incrementally, once every SECONDS')
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,192 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Collector frame handling
+#   Version:            1
+#
+#   Description:
+#       What the collector does with each frame once it's off the serial port: decode it, update
+#       the node's thermal background or queue a data row, and write changed backgrounds once per
+#       batch. Kept apart from "data collecter.py" so the benchmark can run the same code without
+#       a serial port.
+#
+#       serial_reader() and database_writer() are the two sides of the collector: one owns the
+#       serial port and queues timestamped frames, the other stores whatever has queued up in the
+#       database thread. They're here so the benchmark can drive the same path with a simulated port.
+#
+#       With a knn.FrameEstimator, each data frame's occupancy estimate is queued for the KNN table
+#       after the batch's data rows. This runs in the database thread, so it never holds up the serial port.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy
+
+import asyncio
+import datetime
+import time
+import storage
+from xbee import REMOTE_AT_RESPONSE
+
+QUEUE_SIZE = 500  # frames waiting for the database writer before the serial task has to wait
+DATA_INSERT = ("INSERT INTO data"
+               " (Node, Datetime, Epoch, Frame, Trigger, CO2PPM, Temperature, Humidity, PIR)"
+               " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def create_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS data"
+                 " (Node real, Datetime text, Grideye text, Trigger int, CO2PPM real, Temperature real,"
+                 " Humidity real, PIR real, Frame blob, Epoch integer)")
+    storage.prepare_data(conn)
+    conn.execute("CREATE TABLE IF NOT EXISTS background"
+                 " (Node integer PRIMARY KEY, Datetime text, Background text, Sample integer, Mean text,"
+                 " SumSqDif text)")
+
+
+class MyList(list):
+    def __repr__(self):
+        return '[' + ', '.join("0x%X" % x if type(x) is int else repr(x) for x in self) + ']'
+
+
+class FrameStore:
+    def __init__(self, writer, backgrounds, verbose=True, estimator=None):
+        self.writer = writer            # storage.BatchWriter
+        self.backgrounds = backgrounds  # thermal.BackgroundModels
+        self.verbose = verbose          # print every frame like the collector always has
+        self.estimator = estimator      # knn.FrameEstimator, or None to leave estimates to "knn algorithm.py"
+        self.estimates = []             # estimate rows of the batch being stored
+
+    def store_frames(self, frames):
+        # frames is a list of (received, data) pairs: the datetime the frame came off the serial port
+        # and the 0x90 frame without the frame type byte
+        for received, data in frames:
+            self.data_store(data, received)
+        # after the data rows, so each kind goes to the writer as one run
+        for row in self.estimates:
+            self.writer.add(self.estimator.sql, row)
+        self.estimates = []
+        self.backgrounds.save(self.writer)  # one row per node whose background changed in this batch
+        self.writer.poll()
+
+    def data_store(self, data, received=None):
+        # data is the frame after the frame type byte, checksum already verified and stripped,
+        # received is when it was read from the serial port (now if None)
+        if self.verbose:
+            print('data received:')
+            print(MyList(list(data)))
+
+        trigger = 0
+        # Break data into more manageable sections
+        # sixty four source address=data[0:7]
+        # sixteen source address=data[8:9]
+        # receive options address=data[10]
+        # rf_data = data[11:]
+
+        if data[11] == 0xDF:
+            self.inactive_bg(data)
+
+        elif data[11] == 0xEF:
+            self.active_bg(data)
+
+        else:
+            node = data[11]
+            co2 = (data[12] * 200)
+            humid = ((data[13] << 8) | data[14]) / 10
+            temp = ((data[15] << 8) | data[16]) / 10
+            pir = data[17]
+
+            # the raw grideye registers are stored as they are, see storage.decode_frames()
+            frame = bytes(data[18:18 + storage.FRAME_BYTES])
+            grideye = storage.decode_frame(frame)
+            if (grideye > 25).any():
+                trigger = 1
+
+            # the time it arrived, not when it got out of the queue, as text and as microseconds since
+            # 1970 for the analysis
+            if received is None:
+                received = datetime.datetime.now()
+            current = received.strftime(storage.TIME_FORMAT)
+
+            # insert data into database
+            self.writer.add(DATA_INSERT, (node, current, storage.to_epoch(received), frame, trigger, co2, temp, humid,
+                                          pir))
+            if self.estimator is not None:
+                estimate = self.estimator.estimate(node, grideye)
+                if estimate is not None:
+                    self.estimates.append((node, current) + estimate)
+
+    def inactive_bg(self, packet):
+        # update the thermal background and pixel statistics, or create a new entry if a background doesn't exist
+        node = packet[12]
+        self.backgrounds.inactive_update(node, storage.decode_frame(packet[14:14 + storage.FRAME_BYTES]))
+        if self.verbose:
+            print('inactive background update complete')
+
+    def active_bg(self, packet):
+        node = packet[12]
+        if not self.backgrounds.active_update(node, storage.decode_frame(packet[14:14 + storage.FRAME_BYTES])):
+            if self.verbose:
+                print('active background update failed\n')
+            return
+        if self.verbose:
+            print('active background update complete')
+
+
+def new_link():
+    # backpressure metrics for the queue between serial_reader() and database_writer()
+    return {'queued': 0, 'max_depth': 0, 'stalls': 0, 'stall_time': 0.}
+
+
+async def serial_reader(loop, queue, serial_pool, ser, decoder, poller, outgoing, link):
+    # the only task that touches the serial port: sends whatever the poller has queued up in outgoing,
+    # decodes frames and hands (received, data) to the database writer through the queue
+    while True:
+        while outgoing:
+            await loop.run_in_executor(serial_pool, ser.write, outgoing.popleft())
+        if not await loop.run_in_executor(serial_pool, decoder.read):
+            continue
+        for frame in decoder.frames():
+            now = time.monotonic()
+            if frame[0] == REMOTE_AT_RESPONSE:
+                poller.handle_response(frame, now)
+                continue
+            poller.saw_data(bytes(frame[1:9]), now)  # 64 bit source address of the node
+            data = bytes(frame[1:])  # the frame is a view into the decoder's buffer, copy it before queueing
+            # stamped here, the database thread may only get to it after a backlog has cleared
+            received = datetime.datetime.now()
+            if queue.full():
+                # the writer has fallen behind, wait for it rather than dropping frames
+                link['stalls'] += 1
+                stalled = time.monotonic()
+                await queue.put((received, data))
+                link['stall_time'] += time.monotonic() - stalled
+            else:
+                queue.put_nowait((received, data))
+            link['queued'] += 1
+            link['max_depth'] = max(link['max_depth'], queue.qsize())
+
+
+async def database_writer(loop, queue, db_pool, store):
+    # takes everything waiting in the queue at once and stores it in the database thread,
+    # so a slow write never holds up the serial port
+    writer = store.writer
+    while True:
+        try:
+            frames = [await asyncio.wait_for(queue.get(), writer.time_left())]
+        except asyncio.TimeoutError:
+            await loop.run_in_executor(db_pool, writer.flush)
+            continue
+        frames.extend(waiting(queue))
+        await loop.run_in_executor(db_pool, store.store_frames, frames)
+
+
+def waiting(queue):
+    # everything in the queue right now, without waiting for more
+    frames = []
+    while not queue.empty():
+        frames.append(queue.get_nowait())
+    return frames
@@ -0,0 +1,302 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Collector benchmark
+#   Version:            1
+#
+#   Description:
+#       Measures how much the base station can take. Traffic from simulator.Simulator is pushed
+#       through the collector's own code (xbee.FrameDecoder, collection.FrameStore and
+#       storage.BatchWriter on a real database file) for every combination of node count and
+#       frame rate, and reports:
+#           capacity     frames/second when frames are fed as fast as they can be handled
+#           cpu_ms       CPU time per frame
+#           db_bytes     database growth per frame
+#           p50/p99      latency from a frame coming off the serial port to its row being committed,
+#                        measured while frames arrive at the real rate
+#           max_depth    most frames waiting in the queue for the database thread, and
+#           stalls       how often the serial side had to wait for room in it
+#       The latency run is the collector's whole path: the poller finds the nodes and asks them for
+#       data through a simulated serial port (SimSerial), and collection.serial_reader() and
+#       database_writer() move the frames through the queue to the database thread.
+#       With --estimate DB every data frame also gets its KNN occupancy estimate (knn.FrameEstimator)
+#       from the training table of DB, like the collector run with --estimate.
+#       The collector prints every frame unless it's run with --quiet, so capacity and cpu_ms are
+#       also measured that way (verbose f/s, verbose cpu) with the printing going to os.devnull:
+#       the formatting is counted, the terminal isn't.
+#       Results are written as JSON so runs from different versions can be compared:
+#           python "collector benchmark.py" --output before.json
+#           python "collector benchmark.py" --compare before.json
+#
+#   Dependencies:
+#       Python 3.5.1, numpy, sqlite3
+
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import storage
+import thermal
+import collection
+from polling import PollScheduler
+from simulator import Simulator, synthetic_frames
+from xbee import FrameDecoder, remote_at, BROADCAST, RX_PACKET, REMOTE_AT_REQUEST
+
+NODE_COUNTS = [1, 4, 16, 64]
+FRAME_RATES = [1., 10.]  # the grideye's 1 fps and 10 fps modes
+CHUNK = 4096             # bytes handed to the decoder at a time in the capacity run
+TICK = 0.01              # serial read timeout in the latency run
+POLL_TICK = 0.1          # how often the poller checks its deadlines, as in the collector
+MODEL = None             # knn.KnnModel for inline estimates, set by --estimate
+
+
+class TimedWriter(storage.BatchWriter):
+    # BatchWriter that records how long each data row waited between its frame coming off the serial
+    # port (the row's Epoch) and being committed, in seconds
+    def __init__(self, conn, **kwargs):
+        super().__init__(conn, **kwargs)
+        self.waiting = []
+        self.latencies = []
+
+    def add(self, sql, row):
+        if sql is collection.DATA_INSERT:
+            self.waiting.append(row[2])
+        super().add(sql, row)
+
+    def flush(self):
+        super().flush()
+        committed = storage.to_epoch(datetime.datetime.now())
+        self.latencies.extend((committed - i) / 1e6 for i in self.waiting)
+        self.waiting = []
+
+
+class SimSerial:
+    # the serial port with the coordinator and the simulated network behind it, running in real time.
+    # Reads wait up to timeout for packets, writes are requests for the simulator
+    def __init__(self, sim, timeout=TICK):
+        self.sim = sim
+        self.timeout = timeout
+        self.requests = FrameDecoder(None, frame_types=(REMOTE_AT_REQUEST,))
+        self.pending = b''
+        self.start = self.last = time.monotonic()  # the simulator's clock starts at 0
+
+    def poll(self):
+        now = time.monotonic()
+        self.pending += b''.join(self.sim.due(now - self.start, now - self.last))
+        self.last = now
+
+    @property
+    def in_waiting(self):
+        self.poll()
+        return len(self.pending)
+
+    def read(self, size):
+        deadline = time.monotonic() + self.timeout
+        self.poll()
+        while not self.pending and time.monotonic() < deadline:
+            time.sleep(self.timeout / 10)
+            self.poll()
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def write(self, packet):
+        self.requests.feed(packet)
+        for frame in self.requests.frames():
+            self.sim.handle(frame, time.monotonic() - self.start)
+
+
+def start_streaming(sim):
+    # what the collector's poller would do: ask every node for data
+    request = remote_at(BROADCAST, b'D1', b'\x05', frame_id=1)
+    sim.handle(memoryview(request)[3:-1], 0.)
+
+
+def open_store(path, verbose=False, **kwargs):
+    conn = storage.connect(path, check_same_thread=False)  # the latency run writes from its database thread
+    collection.create_tables(conn)
+    writer = TimedWriter(conn, **kwargs)
+    backgrounds = thermal.BackgroundModels.load(conn)
+    estimator = None
+    if MODEL is not None:
+        import knn
+        knn.create_tables(conn)
+        estimator = knn.FrameEstimator(MODEL, backgrounds)
+    store = collection.FrameStore(writer, backgrounds, verbose=verbose, estimator=estimator)
+    return conn, writer, store
+
+
+def db_size(conn, path):
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    return os.path.getsize(path)
+
+
+def handle(decoder, store):
+    received = datetime.datetime.now()
+    frames = [(received, bytes(i[1:])) for i in decoder.frames() if i[0] == RX_PACKET]
+    store.store_frames(frames)
+    return len(frames)
+
+
+def capacity_run(nodes, fps, frames, count, bg_interval, workdir, verbose=False):
+    # generate count frames of traffic up front, then time how fast they go through, printing every
+    # frame like the collector does without --quiet if verbose
+    sim = Simulator(frames, nodes, fps, bg_interval, seed=0)
+    start_streaming(sim)
+    packets = []
+    now = 0.
+    while len(packets) < count:
+        now += 1. / fps
+        packets.extend(sim.due(now, 1. / fps))
+    stream = b''.join(packets)
+
+    path = os.path.join(workdir, 'capacity_{}_{}{}.db'.format(nodes, int(fps), '_verbose' if verbose else ''))
+    conn, writer, store = open_store(path, verbose)
+    decoder = FrameDecoder(None)
+    before = db_size(conn, path)
+
+    stored = 0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull if verbose else sys.stdout):
+        wall, cpu = time.perf_counter(), time.process_time()
+        i = 0
+        while i < len(stream):
+            i += decoder.feed(stream[i:i + min(CHUNK, decoder.space())])
+            stored += handle(decoder, store)
+        writer.flush()
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    rows = conn.execute('SELECT count(*) FROM data').fetchone()[0]
+    growth = db_size(conn, path) - before
+    conn.close()
+    return {'frames': stored, 'rows': rows, 'capacity': stored / wall, 'cpu_ms': 1000 * cpu / stored,
+            'db_bytes': growth / rows if rows else None, 'decoder': decoder.stats()}
+
+
+def latency_run(nodes, fps, frames, duration, bg_interval, workdir, max_rows, max_delay):
+    # run the collector against the simulator at its real rate and time each row from its frame coming
+    # off the serial port to its commit
+    sim = Simulator(frames, nodes, fps, bg_interval, seed=0)
+    path = os.path.join(workdir, 'latency_{}_{}.db'.format(nodes, int(fps)))
+    conn, writer, store = open_store(path, max_rows=max_rows, max_delay=max_delay)
+    decoder = FrameDecoder(SimSerial(sim))
+    outgoing = deque()
+    poller = PollScheduler(outgoing.append)
+    link = collection.new_link()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):  # the poller prints every node
+        asyncio.run(collect(duration, decoder, poller, outgoing, store, link))
+    conn.close()
+
+    latencies = np.array(writer.latencies) * 1000
+    result = {'p50_ms': None, 'p99_ms': None, 'max_depth': link['max_depth'], 'stalls': link['stalls']}
+    if len(latencies):
+        result.update(p50_ms=float(np.percentile(latencies, 50)), p99_ms=float(np.percentile(latencies, 99)))
+    return result
+
+
+async def collect(duration, decoder, poller, outgoing, store, link):
+    # what "data collecter.py" runs, for duration seconds
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(collection.QUEUE_SIZE)
+    with ThreadPoolExecutor(1) as serial_pool, ThreadPoolExecutor(1) as db_pool:
+        try:
+            await asyncio.wait_for(asyncio.gather(
+                collection.serial_reader(loop, queue, serial_pool, decoder.ser, decoder, poller, outgoing, link),
+                poll_nodes(poller),
+                collection.database_writer(loop, queue, db_pool, store)), duration)
+        except asyncio.TimeoutError:
+            pass
+        await loop.run_in_executor(db_pool, store.store_frames, collection.waiting(queue))
+        await loop.run_in_executor(db_pool, store.writer.flush)
+
+
+async def poll_nodes(poller):
+    while True:
+        poller.tick(time.monotonic())
+        await asyncio.sleep(POLL_TICK)
+
+
+def version():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    # print the change in capacity and latency for every configuration in both runs
+    old = {(i['nodes'], i['fps']): i for i in old['results']}
+    print('\n{:>5} {:>5} {:>12} {:>10} {:>10} {:>12}'.format('nodes', 'fps', 'capacity', 'cpu/frame', 'p99',
+                                                          'verbose f/s'))
+    for result in new['results']:
+        before = old.get((result['nodes'], result['fps']))
+        if before is None:
+            continue
+        change = ['{:+.1%}'.format(result[k] / before[k] - 1) if result.get(k) and before.get(k) else '-'
+                  for k in ('capacity', 'cpu_ms', 'p99_ms', 'verbose_capacity')]
+        print('{:>5} {:>5} {:>12} {:>10} {:>10} {:>12}'.format(result['nodes'], result['fps'], *change))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Collector throughput and latency benchmark')
+    parser.add_argument('--nodes', type=int, nargs='+', default=NODE_COUNTS)
+    parser.add_argument('--fps', type=float, nargs='+', default=FRAME_RATES)
+    parser.add_argument('--frames', type=int, default=20000, help='frames per capacity run')
+    parser.add_argument('--duration', type=float, default=10., help='seconds per latency run')
+    parser.add_argument('--bg-interval', type=float, default=10., help='seconds between background packets')
+    parser.add_argument('--max-rows', type=int, default=50, help='BatchWriter max_rows')
+    parser.add_argument('--max-delay', type=float, default=5., help='BatchWriter max_delay')
+    parser.add_argument('--estimate', metavar='DB', help='estimate occupancy inline with the training table of DB')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', metavar='JSON', help='compare against results from an earlier run')
+    args = parser.parse_args()
+
+    if args.estimate:
+        import knn
+        training = sqlite3.connect(args.estimate)
+        MODEL = knn.load_model(training)
+        training.close()
+    frames = synthetic_frames(240)
+    results = []
+    print('{:>5} {:>5} {:>12} {:>10} {:>10} {:>10} {:>10} {:>12} {:>12}'.format(
+        'nodes', 'fps', 'frames/s', 'cpu ms', 'db bytes', 'p50 ms', 'p99 ms', 'verbose f/s', 'verbose cpu'))
+    with tempfile.TemporaryDirectory() as workdir:
+        for nodes in args.nodes:
+            for fps in args.fps:
+                result = {'nodes': nodes, 'fps': fps}
+                result.update(capacity_run(nodes, fps, frames, args.frames, args.bg_interval, workdir))
+                result.update(latency_run(nodes, fps, frames, args.duration, args.bg_interval, workdir,
+                                          args.max_rows, args.max_delay))
+                verbose = capacity_run(nodes, fps, frames, args.frames, args.bg_interval, workdir, verbose=True)
+                result.update(verbose_capacity=verbose['capacity'], verbose_cpu_ms=verbose['cpu_ms'])
+                results.append(result)
+                print('{:>5} {:>5} {:>12.0f} {:>10.3f} {:>10.1f} {:>10} {:>10} {:>12.0f} {:>12.3f}'.format(
+                    nodes, fps, result['capacity'], result['cpu_ms'], result['db_bytes'] or 0,
+                    '-' if result['p50_ms'] is None else '{:.1f}'.format(result['p50_ms']),
+                    '-' if result['p99_ms'] is None else '{:.1f}'.format(result['p99_ms']),
+                    result['verbose_capacity'], result['verbose_cpu_ms']))
+
+    report = {'version': version(), 'python': platform.python_version(), 'machine': platform.machine(),
+              'settings': vars(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
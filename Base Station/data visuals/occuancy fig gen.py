@@ -1,8 +1,12 @@
 import numpy as np
 from matplotlib import pyplot as plt
 import sqlite3
-import datetime as dt
 import math
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import storage  # shared database helpers live in the Base Station folder
 
 conn = sqlite3.connect("occupancy.db")
 c = conn.cursor()
@@ -45,23 +49,16 @@ else:
     datetime_data = c.fetchall()
 
 # lets find RMSE for data with not rounded values
-sqdifs = []
-
-for i in range(len(guess)):
-    sqdifs.append((guess[i]-gtruth[i][0])**2)
+guesses = np.array(guess, dtype=np.float64)
+truth = np.array([x[0] for x in gtruth], dtype=np.float64)
 
-mean = sum(sqdifs)/len(sqdifs)
+mean = np.mean((guesses - truth) ** 2)
 rmse = math.sqrt(mean)
 print('Mean of SSD of non rounded values is: {}'.format(mean))
 print('RMSE of non rounded values is : {}'.format(rmse))
 
 # finding RMSE using rounded values
-sqdifs = []
-
-for i in range(len(guess)):
-    sqdifs.append((np.round(guess[i])-gtruth[i][0])**2)
-
-mean = sum(sqdifs)/len(sqdifs)
+mean = np.mean((np.round(guesses) - truth) ** 2)
 rmse = math.sqrt(mean)
 print('Mean of SSD of rounded values is: {}'.format(mean))
 print('RMSE of rounded values is : {}'.format(rmse))
@@ -69,12 +66,11 @@ print('RMSE of rounded values is : {}'.format(rmse))
 xplots = []
 yplots = []
 
-for x in datetime_data:
-    xplots.append(dt.datetime.strptime(x[0], "%Y-%m-%dT%H:%M:%S:%f"))
+xplots = storage.parse_times([x[0] for x in datetime_data])
 
 # format times on x axis
 ticks_to_plot = xplots[1::20]
-labels = [dt.datetime.strftime(i, "%H:%M:%S") for i in ticks_to_plot]
+labels = [i[11:] for i in np.datetime_as_string(ticks_to_plot, unit='s')]
 
 # take KNN guesses, round them to nearest int and put them in list for graphing
 for i in guess:
@@ -1,7 +1,12 @@
+import os
+import sys
 import numpy as np
 import matplotlib.pyplot as plt
 import sqlite3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import storage  # shared database helpers live in the Base Station folder
+
 # conn = sqlite3.connect('D:\Google Drive\School\Thesis\Codes\Raspberry Pi\current\grideye revA\occupancy.db')
 # conn = sqlite3.connect("C:\\Users\\ovie7\\Google Drive\\School\\Thesis\\Codes\\Raspberry Pi\\current\\grideye revA\\occupancy.db")
 conn = sqlite3.connect("occupancy.db")
@@ -14,12 +19,13 @@ if start == 'all':
 elif start == 'test':
     start = '2017-11-15T11:30'
     end = '2017-11-15T18:30'
-    c.execute('SELECT AvgBearing FROM blobs WHERE TimeStart BETWEEN "{}" AND "{}" AND Readings BETWEEN 2 AND 10'.format(start, end))
+    c.execute('SELECT AvgBearing FROM blobs WHERE StartEpoch BETWEEN ? AND ? AND Readings BETWEEN 2 AND 10',
+              (storage.to_epoch_bound(start), storage.to_epoch_bound(end)))
     angles = c.fetchall()
 else:
     end = input("Ending date/time (Format: YYYY-MM-DDTHH:mm:ss): ")
-    c.execute('SELECT AvgBearing FROM blobs WHERE TimeStart BETWEEN "{}" AND "{}" AND Readings BETWEEN 2 AND 10'
-              .format(start, end))
+    c.execute('SELECT AvgBearing FROM blobs WHERE StartEpoch BETWEEN ? AND ? AND Readings BETWEEN 2 AND 10',
+              (storage.to_epoch_bound(start), storage.to_epoch_bound(end)))
     angles = c.fetchall()
 
 angles = [i[0] for i in angles]
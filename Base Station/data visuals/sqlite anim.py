@@ -28,21 +28,25 @@
 #        rotated video to be consistant with caluclations from algorithm
 #        basically converted rows and columns array indices to x and y coordinates
 
+import os
+import sys
 import numpy as np
 from matplotlib import pyplot as plt
 import sqlite3
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import storage  # shared database helpers live in the Base Station folder
+
 
 fps = 5
 
 # connect to database and fetch data
 datab = input("Make video from traffic database or KNN database? \n 1: traffic\n2: KNN\n")
-if datab = 1:
-	conn = sqlite3.connect("occupancy.db")
-elif datab = 2:
-		conn = sqlite3.connect("train_occupancy.db")
+if datab == '1':
+    conn = sqlite3.connect("occupancy.db")
+elif datab == '2':
+    conn = sqlite3.connect("train_occupancy.db")
 
-c = conn.cursor()
 
 # start = input("Starting date/time (Format: YYYY-MM-DDTHH:mm:ss) (enter 'all' to take all measurements: ")
 # if start != 'all':
@@ -53,38 +57,27 @@ file_name = input("Enter a file name: ") or "animation"
 
 start = input("Starting date/time (Format: YYYY-MM-DDTHH:mm:ss) (enter 'all' to take all measurements): ")
 if start == 'all':
-    c.execute('SELECT Grideye FROM data')
-    grideye_data = c.fetchall()
-    c.execute('SELECT Datetime FROM data')
-    datetime_data = c.fetchall()
+    start = end = None
 # elif start == 'test':
 #     start = '2017-10-06T05:47:09:231006'
 #     end = '2017-10-06T05:48:28:725764'
-#     c.execute('SELECT Grideye FROM data WHERE Datetime BETWEEN "{}" AND "{}"'.format(start, end))
+#     c.execute('SELECT Frame, Grideye FROM data WHERE Datetime BETWEEN "{}" AND "{}"'.format(start, end))
 #     grideye_data = c.fetchall()
 #     c.execute('SELECT Datetime FROM data WHERE Datetime BETWEEN "{}" AND "{}"'.format(start, end))
 #     datetime_data = c.fetchall()
 else:
     end = input("Ending date/time (Format: YYYY-MM-DDTHH:mm:ss): ")
-    c.execute('SELECT Grideye FROM data WHERE Datetime BETWEEN "{}" AND "{}"'.format(start, end))
-    grideye_data = c.fetchall()
-    c.execute('SELECT Datetime FROM data WHERE Datetime BETWEEN "{}" AND "{}"'.format(start, end))
-    datetime_data = c.fetchall()
-
-# convert string from sql database to list
-for idx, x in enumerate(grideye_data):
-    grideye_data[idx] = [float(i) for i in x[0].split(',') if i != '0']
 
-for idx, x in enumerate(datetime_data):
-    datetime_data[idx] = x[0]
+# frames between start and end on the indexed Epoch column, already decoded to 8x8 arrays, node by node
+chunks = list(storage.read_frames(conn, None, start, end))
+gridata = np.concatenate([i['frames'] for i in chunks]) if chunks else np.empty((0, 8, 8))
+datetime_data = np.concatenate([i['Datetime'] for i in chunks]).tolist() if chunks else []
 
 # for idx, x in enumerate(new_regions):
 #     new_regions[idx] = x[0]
 
-gridata = np.array(grideye_data).reshape((len(grideye_data), 8, 8))
-for idx, i in enumerate(gridata):
-    gridata[idx] = np.rot90(gridata[idx])
-    grideye_data[idx] = gridata[idx].flatten()
+gridata = np.rot90(gridata, axes=(1, 2))
+grideye_data = gridata.reshape((len(gridata), 64))
 
 
 # Set up the figure
@@ -0,0 +1,129 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Per frame feature cache
+#   Version:            1
+#
+#   Description:
+#       The hotspots found in each frame (size, centroid and mean temperature of each one) are
+#       kept in the features table, so the traffic, KNN and training pipelines only decode and
+#       label frames nobody has labelled with the same threshold before. Rows are keyed by node,
+#       frame Epoch and Params, a hash of the 8x8 threshold used. The threshold covers both the
+#       std dev multiplier (5 for traffic and training, 6 for KNN) and the background it was
+#       worked out from, so a different multiplier or a newer background only misses its own rows.
+#
+#       Every background change makes a new Params set and the old ones are never read again, so
+#       features_params keeps when each set was last used. When a node gets a new set, only its
+#       MAX_PARAMS most recently used sets are kept and the rest are deleted.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy
+
+import datetime
+import hashlib
+import numpy as np
+import storage
+from hotspots import HotspotTable, HOTSPOT_DTYPE
+
+# a frame's hotspots as stored in the Spots column, one after the other
+SPOT_DTYPE = np.dtype([('label', '<i4'), ('size', '<i4'), ('centroid', '<f8', (2,)), ('temp', '<f8')])
+MAX_PARAMS = 4  # sets kept per node: the traffic/training and KNN multipliers, current and previous background
+FEATURE_INSERT = ("INSERT OR IGNORE INTO features (Node, Params, Epoch, Pixels, Hotspots, Spots)"
+                  " VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def create_table(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS features"
+                 " (Node integer, Params text, Epoch integer, Pixels integer, Hotspots integer, Spots blob,"
+                 " PRIMARY KEY (Node, Params, Epoch)) WITHOUT ROWID")
+    conn.execute("CREATE TABLE IF NOT EXISTS features_params"
+                 " (Node integer, Params text, Used integer, PRIMARY KEY (Node, Params))")
+
+
+def params_key(threshold):
+    # Params value for the rows labelled with this threshold
+    return hashlib.sha1(np.asarray(threshold, dtype=np.float64).tobytes()).hexdigest()[:16]
+
+
+def use_params(conn, node, params, keep=MAX_PARAMS):
+    # record that the node's params set is in use. The first time a set is seen, only the node's keep most
+    # recently used sets (this one included) are kept, rows of any other set are deleted
+    now = storage.to_epoch(datetime.datetime.now())
+    with conn:
+        if conn.execute('UPDATE features_params SET Used = ? WHERE Node = ? AND Params = ?',
+                        (now, node, params)).rowcount:
+            return
+        conn.execute('INSERT INTO features_params (Node, Params, Used) VALUES (?, ?, ?)', (node, params, now))
+        kept = [i[0] for i in conn.execute('SELECT Params FROM features_params WHERE Node = ? ORDER BY Used DESC'
+                                           ' LIMIT ?', (node, keep))]
+        conn.execute('DELETE FROM features_params WHERE Node = ? AND Params NOT IN ({})'.format(
+            ', '.join('?' * len(kept))), [node] + kept)
+        conn.execute('DELETE FROM features WHERE Node = ? AND Params NOT IN ({})'.format(
+            ', '.join('?' * len(kept))), [node] + kept)
+
+
+def frame_blobs(table):
+    # Spots value of each frame of a HotspotTable
+    spots = np.empty(len(table), dtype=SPOT_DTYPE)
+    for name in SPOT_DTYPE.names:
+        spots[name] = table.hotspots[name]
+    data = spots.tobytes()
+    size = SPOT_DTYPE.itemsize
+    return [data[size * table.offsets[i]:size * table.offsets[i + 1]] for i in range(table.count)]
+
+
+def table_from_blobs(blobs, counts):
+    # HotspotTable of frames stored as Spots values, counts is the number of hotspots in each
+    spots = np.frombuffer(b''.join(blobs), dtype=SPOT_DTYPE)
+    hotspots = np.empty(len(spots), dtype=HOTSPOT_DTYPE)
+    hotspots['frame'] = np.repeat(np.arange(len(counts)), counts)
+    for name in SPOT_DTYPE.names:
+        hotspots[name] = spots[name]
+    return HotspotTable(hotspots, len(counts))
+
+
+def read_features(conn, node, threshold, start=None, end=None, arraysize=storage.ARRAYSIZE):
+    # like storage.read_frames(), but each chunk has the frames' hotspots as a HotspotTable under 'table'
+    # instead of the frames themselves. Hotspots are read from the features table where they're there,
+    # the rest of the frames are labelled with threshold and stored for next time, a chunk per transaction.
+    storage.prepare_data(conn)
+    storage.backfill_epochs(conn)
+    create_table(conn)
+    params = params_key(threshold)
+    use_params(conn, node, params)
+    where, args = storage.data_filter(node, start, end)
+    # the frame columns are only read for frames without features
+    sql = ("SELECT data.Epoch, data.rowid, data.Datetime, features.Hotspots, features.Spots,"
+           " CASE WHEN features.Epoch IS NULL THEN data.Frame END,"
+           " CASE WHEN features.Epoch IS NULL THEN data.Grideye END"
+           " FROM data LEFT JOIN features"
+           " ON features.Node = data.Node AND features.Params = ? AND features.Epoch = data.Epoch")
+    # a page at a time, so nothing is being read while a page's new features are written
+    after = (' AND ' if where else ' WHERE ') + 'data.Epoch >= ? AND (data.Epoch > ? OR data.rowid > ?)'
+    last = []
+    while True:
+        page = sql + where + (after if last else '') + ' ORDER BY data.Epoch, data.rowid LIMIT ?'
+        rows = conn.execute(page, [params] + args + last + [arraysize]).fetchall()
+        if not rows:
+            break
+        last = [rows[-1][0], rows[-1][0], rows[-1][1]]
+        epochs, _, times, counts, blobs, frames, texts = (list(i) for i in zip(*rows))
+        missing = [i for i, n in enumerate(counts) if n is None]
+        if missing:
+            found = HotspotTable.from_frames(storage.decode_frames((frames[i], texts[i]) for i in missing), threshold)
+            new = frame_blobs(found)
+            pixels = found.active_pixels().tolist()
+            spots = found.counts().tolist()
+            for j, i in enumerate(missing):
+                counts[i] = spots[j]
+                blobs[i] = new[j]
+            with conn:
+                conn.executemany(FEATURE_INSERT, [(node, params, epochs[i], pixels[j], spots[j], new[j])
+                                                  for j, i in enumerate(missing)])
+        yield {'Node': np.full(len(rows), node), 'Datetime': np.array(times),
+               'Epoch': np.array(epochs, dtype=np.int64), 'table': table_from_blobs(blobs, counts)}
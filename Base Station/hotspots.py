@@ -0,0 +1,120 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Hotspot labeling
+#   Version:            1
+#
+#   Description:
+#       Finds the hotspots (groups of touching pixels above their threshold, diagonals included)
+#       in a whole stack of grideye frames at once, instead of flood filling one frame at a time.
+#       Hotspots are numbered frame by frame in the order the old floodfill found them
+#       (by their first pixel, row by row), so results line up with the earlier analysis.
+#       HotspotTable keeps them as columns of a numpy structured array for the analysis scripts.
+#
+#   Dependencies:
+#       Python 3.5.1, numpy, scipy
+
+import numpy as np
+
+# 8-connected within a frame, never connected across frames
+EIGHT_CONNECTED = np.zeros((3, 3, 3), dtype=bool)
+EIGHT_CONNECTED[1] = True
+
+HOTSPOT_DTYPE = np.dtype([('frame', np.int64), ('label', np.int32), ('size', np.int32),
+                          ('centroid', np.float64, (2,)), ('temp', np.float64)])
+
+
+def label_hotspots(frames, threshold):
+    # frames is an (N, 8, 8) stack, threshold an 8x8 array of per pixel thresholds
+    # returns labels, an (N, 8, 8) array where pixels of hotspot h are h + 1 and everything else 0,
+    # and for each hotspot h: the frame it's in, its size, its temperature weighted centroid
+    # (row, column) and its mean temperature
+    # scipy is imported here so scripts that only read cached features (batch.py knn) start quickly
+    from scipy import ndimage
+    frames = np.asarray(frames)
+    labels, count = ndimage.label(frames > threshold, structure=EIGHT_CONNECTED)
+    flat = labels.ravel()
+    temps = frames.ravel().astype(np.float64)
+
+    size = np.bincount(flat, minlength=count + 1)[1:]
+    total = np.bincount(flat, weights=temps, minlength=count + 1)[1:]
+    rows = np.broadcast_to(np.arange(8).reshape((1, 8, 1)), frames.shape).ravel()
+    cols = np.broadcast_to(np.arange(8).reshape((1, 1, 8)), frames.shape).ravel()
+    centroid = np.empty((count, 2))
+    centroid[:, 0] = np.bincount(flat, weights=temps * rows, minlength=count + 1)[1:] / total
+    centroid[:, 1] = np.bincount(flat, weights=temps * cols, minlength=count + 1)[1:] / total
+    mean_temp = total / size
+
+    # labels are handed out in scan order, so the first pixel of each label gives its frame
+    first = np.flatnonzero(flat)
+    frame = np.empty(count, dtype=np.int64)
+    frame[flat[first[::-1]] - 1] = first[::-1] // 64
+    return labels, frame, size, centroid, mean_temp
+
+
+class HotspotTable:
+    # Every hotspot found in a stack of frames as one row of a structured array, in frame order,
+    # instead of a python list per hotspot. Rows are HOTSPOT_DTYPE:
+    #   frame       index of the frame the hotspot is in
+    #   label       hotspot number within its frame, counting from 1
+    #   size        number of pixels
+    #   centroid    temperature weighted (row, column)
+    #   temp        mean temperature
+    # Which pixels belong to which hotspot is only kept if asked for, as an (N, 8, 8) array of labels.
+    def __init__(self, hotspots, count, labels=None):
+        self.hotspots = hotspots  # structured array of HOTSPOT_DTYPE
+        self.count = count        # number of frames, including frames without hotspots
+        self.labels = labels      # None, or each pixel's hotspot label (0 for none)
+        # hotspots of frame i are rows offsets[i] to offsets[i + 1]
+        self.offsets = np.searchsorted(hotspots['frame'], np.arange(count + 1))
+
+    @classmethod
+    def from_frames(cls, frames, threshold, pixels=False):
+        labels, frame, size, centroid, temp = label_hotspots(frames, threshold)
+        hotspots = np.empty(len(size), dtype=HOTSPOT_DTYPE)
+        hotspots['frame'] = frame
+        hotspots['size'] = size
+        hotspots['centroid'] = centroid
+        hotspots['temp'] = temp
+        table = cls(hotspots, len(frames))
+        hotspots['label'] = np.arange(len(size)) - table.offsets[frame] + 1
+        if pixels:
+            # number each frame's hotspots from 1 like the label field
+            first = table.offsets[:-1].reshape((-1, 1, 1)).astype(labels.dtype)
+            table.labels = np.where(labels > 0, labels - first, 0)
+        return table
+
+    def __len__(self):
+        return len(self.hotspots)
+
+    def frame(self, i):
+        # the hotspots in frame i
+        return self.hotspots[self.offsets[i]:self.offsets[i + 1]]
+
+    def frames(self):
+        for i in range(self.count):
+            yield self.frame(i)
+
+    def counts(self):
+        # number of hotspots in each frame
+        return np.diff(self.offsets)
+
+    def active_pixels(self):
+        # number of pixels above threshold in each frame
+        return np.bincount(self.hotspots['frame'], weights=self.hotspots['size'], minlength=self.count).astype(int)
+
+    def slice(self, start, stop):
+        # the hotspots of frames start to stop as a table of their own
+        hotspots = self.hotspots[self.offsets[start]:self.offsets[stop]].copy()
+        hotspots['frame'] -= start
+        labels = None if self.labels is None else self.labels[start:stop]
+        return HotspotTable(hotspots, stop - start, labels)
+
+    def pixels(self, frame, label):
+        # 8x8 mask of the pixels of one hotspot, needs the table built with pixels=True
+        return self.labels[frame] == label
@@ -0,0 +1,160 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              KNN parameter sweep
+#   Version:            1
+#
+#   Description:
+#       Scores the KNN estimate against the ground truth typed into the KNN table for every
+#       combination of k, threshold multiplier and distance metric, and reports the RMSE of the
+#       raw and rounded estimates of each with how long it took. The frames with ground truth
+#       are read and decoded once; each multiplier labels them once in a worker process, and
+#       every k and metric is then scored from the distinct (pixels, hotspots) pairs in one go.
+#       The training table is used as it is, only the threshold of the frames being scored changes.
+#           python "knn parameter sweep.py" --node 1 --start 2018-09-29T19:36:58 --end 2018-09-29T19:47:12
+#           python "knn parameter sweep.py" --k 1 3 5 7 --multiplier 5 6 --metric euclidean --output sweep.csv
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sqlite3
+import time
+import numpy as np
+import knn
+import storage
+import thermal
+from hotspots import HotspotTable
+
+K_VALUES = [1, 2, 3, 4, 5, 6, 8, 10, 15]
+MULTIPLIERS = [4., 4.5, 5., 5.5, 6., 6.5, 7.]
+COLUMNS = ['k', 'multiplier', 'metric', 'rmse', 'rounded_rmse', 'ms']
+
+SWEEP = {}  # what every worker scores against, set by setup()
+
+
+def load_truth(conn, node, start=None, end=None):
+    # Epoch, frame and ground truth of every frame of node between start and end with gtruth filled in
+    knn.create_tables(conn)
+    sql = 'SELECT Times, gtruth FROM KNN WHERE Node = ? AND gtruth IS NOT NULL'
+    params = [node]
+    # Times is Datetime text, which sorts the same as the time itself
+    for bound, op in ((start, '>='), (end, '<=')):
+        if bound is not None:
+            sql += ' AND Times {} ?'.format(op)
+            params.append(storage.from_epoch(storage.to_epoch_bound(bound)).strftime(storage.TIME_FORMAT))
+    rows = conn.execute(sql, params).fetchall()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty((0, 8, 8)), np.empty(0)
+    epochs = storage.parse_times([i[0] for i in rows]).astype(np.int64)
+    truth = np.array([i[1] for i in rows], dtype=np.float64)
+    order = np.argsort(epochs)
+    epochs, truth = epochs[order], truth[order]
+    # one pass over the data between the first and last of them, keeping just those frames
+    kept = []
+    for chunk in storage.read_frames(conn, node, int(epochs[0]), int(epochs[-1])):
+        keep = np.isin(chunk['Epoch'], epochs)
+        kept.append((chunk['Epoch'][keep], chunk['frames'][keep]))
+    frame_epochs = np.concatenate([i[0] for i in kept]) if kept else np.empty(0, dtype=np.int64)
+    frames = np.concatenate([i[1] for i in kept]) if kept else np.empty((0, 8, 8))
+    frame_epochs, first = np.unique(frame_epochs, return_index=True)
+    found = np.isin(epochs, frame_epochs)
+    return epochs[found], frames[first][np.searchsorted(frame_epochs, epochs[found])], truth[found]
+
+
+def setup(frames, truth, training, background, ks, metrics):
+    SWEEP.update(frames=frames, truth=truth, training=training, background=background, ks=ks, metrics=metrics)
+
+
+def score(multiplier):
+    # result rows for every k and metric with frames labelled at multiplier, and the labelling time
+    began = time.perf_counter()
+    table = HotspotTable.from_frames(SWEEP['frames'], SWEEP['background'].threshold(multiplier))
+    # estimates only depend on the two features, so work them out once per distinct pair
+    pairs, inverse = np.unique(np.stack([table.active_pixels(), table.counts()], axis=1), axis=0,
+                               return_inverse=True)
+    inverse = inverse.ravel()
+    labelled = time.perf_counter() - began
+    training, truth = SWEEP['training'], SWEEP['truth']
+    results = []
+    for metric in SWEEP['metrics']:
+        began = time.perf_counter()
+        distance = knn.distances(training, pairs[:, 0], pairs[:, 1], metric)
+        spent = time.perf_counter() - began
+        for k in SWEEP['ks']:
+            began = time.perf_counter()
+            nearest = np.argpartition(distance, min(k, len(training) - 1), axis=1)[:, :k]
+            guesses = training[nearest, 2].mean(axis=1)[inverse]
+            rmse = np.sqrt(np.mean((guesses - truth) ** 2))
+            rounded = np.sqrt(np.mean((np.round(guesses) - truth) ** 2))
+            ms = (time.perf_counter() - began + spent / len(SWEEP['ks'])) * 1e3
+            results.append([k, multiplier, metric, float(rmse), float(rounded), ms])
+    return results, labelled
+
+
+def sweep(frames, truth, training, background, ks=K_VALUES, multipliers=MULTIPLIERS, metrics=tuple(knn.METRICS),
+          processes=None):
+    # result rows (COLUMNS) for every combination, a multiplier per task, and the labelling time of each multiplier
+    args = (frames, truth, training, background, ks, metrics)
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(multipliers) <= 1:
+        setup(*args)
+        done = list(map(score, multipliers))
+    else:
+        with multiprocessing.Pool(min(processes, len(multipliers)), setup, args) as pool:
+            done = pool.map(score, multipliers)
+    return [row for rows, _ in done for row in rows], [labelled for _, labelled in done]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='RMSE of the KNN estimate for every k, multiplier and metric')
+    parser.add_argument('--db', default='occupancy.db', help='occupancy database')
+    parser.add_argument('--node', type=int, default=knn.TRAINING_NODE, help='node with the ground truth')
+    parser.add_argument('--start', help='first date/time to score')
+    parser.add_argument('--end', help='last date/time to score')
+    parser.add_argument('--k', type=int, nargs='+', default=K_VALUES, help='neighbours per estimate')
+    parser.add_argument('--multiplier', type=float, nargs='+', default=MULTIPLIERS,
+                        help='thresholds in standard deviations above the background')
+    parser.add_argument('--metric', nargs='+', default=list(knn.METRICS), choices=list(knn.METRICS),
+                        help='distance metrics')
+    parser.add_argument('--processes', type=int, help='worker processes (default: all cores)')
+    parser.add_argument('--output', help='also write the results to this CSV file')
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    conn = sqlite3.connect(args.db)
+    epochs, frames, truth = load_truth(conn, args.node, args.start, args.end)
+    training = knn.load_training(conn)
+    background = thermal.BackgroundModels.load(conn).get(args.node)
+    conn.close()
+    if not len(truth):
+        raise SystemExit('no frames of node {} with ground truth in the KNN table'.format(args.node))
+    if background is None:
+        raise SystemExit('no background for node {}'.format(args.node))
+    if max(args.k) > len(training):
+        raise SystemExit('only {} training rows, k can be at most that'.format(len(training)))
+    loaded = time.perf_counter() - began
+    print('{} frames with ground truth read in {:.2f} s, {} training rows'.format(len(truth), loaded, len(training)))
+
+    results, labelled = sweep(frames, truth, training, background, args.k, args.multiplier, args.metric,
+                              args.processes)
+    print('{:>4} {:>10} {:>10} {:>8} {:>13} {:>8}'.format(*COLUMNS))
+    for row in sorted(results, key=lambda i: (i[3], i[4])):
+        print('{:>4} {:>10g} {:>10} {:>8.4f} {:>13.4f} {:>8.3f}'.format(*row))
+    for multiplier, seconds in zip(args.multiplier, labelled):
+        print('multiplier {:g}: frames labelled in {:.3f} s'.format(multiplier, seconds))
+    print('{} settings in {:.2f} s'.format(len(results), time.perf_counter() - began))
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(results)
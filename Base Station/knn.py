@@ -0,0 +1,230 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              KNN occupancy estimation
+#   Version:            1
+#
+#   Description:
+#       The KNN pipeline shared by "knn algorithm.py", "knn training data script.py" and batch.py.
+#       Every frame is described by two features, the number of pixels above threshold and the
+#       number of hotspots. Training rows are frames from the training node with hotspots in them,
+#       labelled by hand with how many people were in view; a frame's estimate is the mean label of
+#       its K nearest training rows.
+#
+#       Both features are small integers, so KnnModel works out the estimate for every possible pair
+#       once and estimating a whole stack of frames is a single lookup. load_model() keeps the model
+#       and builds a new one when the training table has changed.
+#
+#       run_knn(incremental=True) only scores frames newer than the last ones it scored for the node,
+#       kept in the knn_progress table, so keeping the KNN table current costs next to nothing.
+#
+#       FrameEstimator does the same for one frame at a time as the collector stores it, with the
+#       node's background as it is at that moment, so the KNN table fills in as data comes in.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy
+
+import hashlib
+import numpy as np
+import features
+import storage
+import thermal
+from hotspots import HotspotTable, EIGHT_CONNECTED
+
+K = 4
+KNN_MULTIPLIER = 6       # standard deviations above the background for the estimates
+TRAINING_MULTIPLIER = 5  # and for the training rows
+TRAINING_NODE = 1
+PIXELS = 65    # 0 to 64 active pixels
+HOTSPOTS = 33  # an 8x8 frame can't have more than 16 separate hotspots, this leaves room to spare
+BLOCK = 256    # feature pairs worked out at a time when building a model
+
+MODELS = {}    # k -> (digest of the training rows, KnnModel)
+
+# distance between feature pairs from the pixel and hotspot differences
+EUCLIDEAN = 'euclidean'
+METRICS = {
+    EUCLIDEAN: lambda dp, dh: np.sqrt(dh ** 2 + dp ** 2),
+    'manhattan': lambda dp, dh: np.abs(dp) + np.abs(dh),
+    'chebyshev': lambda dp, dh: np.maximum(np.abs(dp), np.abs(dh)),
+}
+
+# KNN rows are keyed on (Node, Times): a rerun updates its estimates and keeps any gtruth typed in
+KNN_UPDATE = "UPDATE KNN SET Pixels = ?, Hotspots = ?, num_people = ? WHERE Node = ? AND Times = ?"
+KNN_INSERT = "INSERT OR IGNORE INTO KNN (Node, Times, Pixels, Hotspots, num_people) VALUES (?, ?, ?, ?, ?)"
+
+
+def create_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS training "
+                 "(Times text, Pixels integer, Hotspots integer, num_people integer) ")
+    # Epoch of the newest frame of each node scored by an incremental run
+    conn.execute("CREATE TABLE IF NOT EXISTS knn_progress (Node integer PRIMARY KEY, Epoch integer)")
+    keyed = [i[1] for i in conn.execute('PRAGMA table_info(KNN)') if i[5]]
+    if keyed:
+        return
+    with conn:
+        old = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'KNN'").fetchone()
+        if old:
+            conn.execute('ALTER TABLE KNN RENAME TO KNN_unkeyed')
+        conn.execute("CREATE TABLE KNN"
+                     "(Node integer, Times text, Pixels integer, Hotspots integer, num_people integer, gtruth integer,"
+                     " PRIMARY KEY (Node, Times)) ")
+        if old:
+            # tables from before the key hold a copy of every frame for each run, keep the latest estimate,
+            # or the latest one someone typed the ground truth in for
+            conn.execute("INSERT OR IGNORE INTO KNN SELECT Node, Times, Pixels, Hotspots, num_people, gtruth"
+                         " FROM KNN_unkeyed ORDER BY gtruth IS NULL, rowid DESC")
+            conn.execute('DROP TABLE KNN_unkeyed')
+
+
+def load_training(conn):
+    # (N, 3) float array of Pixels, Hotspots, num_people of the rows labelled so far. collect_training()
+    # leaves num_people NULL until someone fills it in, those rows would make every estimate near them nan
+    rows = conn.execute('SELECT Pixels, Hotspots, num_people FROM training WHERE num_people IS NOT NULL').fetchall()
+    return np.array(rows, dtype=np.float64).reshape((len(rows), 3))
+
+
+def frame_features(frames, threshold):
+    # number of active pixels and of hotspots in each frame of an (N, 8, 8) stack
+    table = HotspotTable.from_frames(frames, threshold)
+    return table.active_pixels(), table.counts()
+
+
+def distances(training, pixels, hotspots, metric=EUCLIDEAN):
+    # (len(pixels), N) distances from each (pixels, hotspots) pair to each training row
+    dp = training[:, 0] - np.asarray(pixels)[:, np.newaxis]
+    dh = training[:, 1] - np.asarray(hotspots)[:, np.newaxis]
+    return METRICS[metric](dp, dh)
+
+
+def nearest_mean(training, pixels, hotspots, k=K, metric=EUCLIDEAN):
+    # mean number of people of the k training rows closest to each (pixels, hotspots) pair
+    guesses = np.empty(len(pixels))
+    for i in range(0, len(pixels), BLOCK):
+        distance = distances(training, pixels[i:i + BLOCK], hotspots[i:i + BLOCK], metric)
+        nearest = np.argpartition(distance, k, axis=1)[:, :k]
+        guesses[i:i + BLOCK] = training[nearest, 2].mean(axis=1)
+    return guesses
+
+
+class KnnModel:
+    # the estimate for every (pixels, hotspots) pair on the PIXELS x HOTSPOTS grid, from training rows
+    # as returned by load_training()
+    def __init__(self, training, k=K, metric=EUCLIDEAN):
+        self.training = training
+        self.k = k
+        self.metric = metric
+        pixels, hotspots = np.mgrid[0:PIXELS, 0:HOTSPOTS]
+        self.table = self.nearest_mean(pixels.ravel(), hotspots.ravel()).reshape((PIXELS, HOTSPOTS))
+
+    def nearest_mean(self, pixels, hotspots):
+        return nearest_mean(self.training, pixels, hotspots, self.k, self.metric)
+
+    def predict(self, pixels, hotspots):
+        # estimates for arrays of feature pairs, pairs off the grid are worked out from the training rows
+        pixels = np.asarray(pixels, dtype=np.int64)
+        hotspots = np.asarray(hotspots, dtype=np.int64)
+        inside = (pixels < PIXELS) & (hotspots < HOTSPOTS)
+        if inside.all():
+            return self.table[pixels, hotspots]
+        guesses = np.empty(len(pixels))
+        guesses[inside] = self.table[pixels[inside], hotspots[inside]]
+        guesses[~inside] = self.nearest_mean(pixels[~inside], hotspots[~inside])
+        return guesses
+
+
+class FrameEstimator:
+    # features and estimate of single frames as they come in, for the collector. Thresholds come from
+    # backgrounds (the collector's thermal.BackgroundModels) and are worked out again when a background changes
+    def __init__(self, model, backgrounds, multiplier=KNN_MULTIPLIER):
+        self.model = model
+        self.backgrounds = backgrounds
+        self.multiplier = multiplier
+        self.thresholds = {}  # node -> (Datetime of the background, threshold)
+        self.sql = KNN_INSERT  # stores (Node, Times) + estimate() rows
+
+    def threshold(self, node):
+        background = self.backgrounds.get(node)
+        if background is None:
+            return None
+        cached = self.thresholds.get(node)
+        if cached is None or cached[0] != background.updated:
+            cached = self.thresholds[node] = (background.updated, background.threshold(self.multiplier))
+        return cached[1]
+
+    def estimate(self, node, frame):
+        # (pixels, hotspots, estimate) for one decoded 8x8 frame, None while the node has no background.
+        # The same features as frame_features(), without building a HotspotTable for a single frame
+        threshold = self.threshold(node)
+        if threshold is None:
+            return None
+        from scipy import ndimage  # only loaded once the collector has frames to estimate
+        active = frame > threshold
+        pixels = int(active.sum())
+        spots = ndimage.label(active, structure=EIGHT_CONNECTED[1])[1]
+        if pixels < PIXELS and spots < HOTSPOTS:
+            return pixels, spots, float(self.model.table[pixels, spots])
+        return pixels, spots, float(self.model.predict([pixels], [spots])[0])
+
+
+def load_model(conn, k=K):
+    # the KnnModel for the training table as it is now, only rebuilt when the table has changed
+    training = load_training(conn)
+    if len(training) <= k:
+        raise ValueError('{} labelled training rows, the model needs more than k = {}'.format(len(training), k))
+    digest = hashlib.sha1(training.tobytes()).hexdigest()
+    cached = MODELS.get(k)
+    if cached is None or cached[0] != digest:
+        cached = MODELS[k] = (digest, KnnModel(training, k))
+    return cached[1]
+
+
+def run_knn(conn, node, start=None, end=None, k=K, multiplier=KNN_MULTIPLIER, incremental=False):
+    # estimates the occupancy of every frame of node between start and end and stores it in the KNN table,
+    # returns the Epoch of each frame and the estimates as arrays. An incremental run starts after the
+    # newest frame scored by the last incremental run for the node.
+    create_tables(conn)
+    if incremental:
+        mark = conn.execute('SELECT Epoch FROM knn_progress WHERE Node = ?', (node,)).fetchone()
+        if mark is not None and (start is None or storage.to_epoch_bound(start) <= mark[0]):
+            start = mark[0] + 1
+    model = load_model(conn, k)
+    threshold = thermal.cached_threshold(conn, node, multiplier)
+    epochs = []
+    guesses = []
+    # Stream the node's hotspots out of the feature cache a chunk at a time, labelling frames it doesn't have
+    for chunk in features.read_features(conn, node, threshold, start, end):
+        pixels, spots = chunk['table'].active_pixels(), chunk['table'].counts()
+        guess = model.predict(pixels, spots)
+        rows = list(zip(chunk['Datetime'].tolist(), pixels.tolist(), spots.tolist(), guess.tolist()))
+        with conn:  # one transaction per chunk, along with how far the run has got
+            conn.executemany(KNN_UPDATE, [(p, h, g, node, time) for time, p, h, g in rows])
+            conn.executemany(KNN_INSERT, [(node, time, p, h, g) for time, p, h, g in rows])
+            if incremental:
+                conn.execute('REPLACE INTO knn_progress (Node, Epoch) VALUES (?, ?)', (node, int(chunk['Epoch'][-1])))
+        epochs.append(chunk['Epoch'])
+        guesses.append(guess)
+    if not epochs:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    return np.concatenate(epochs), np.concatenate(guesses)
+
+
+def collect_training(conn, node=TRAINING_NODE, start=None, end=None, multiplier=TRAINING_MULTIPLIER):
+    # copies the features of every frame of node with hotspots between start and end into the training
+    # table, num_people is left for labelling by hand. Returns the number of rows added
+    create_tables(conn)
+    threshold = thermal.cached_threshold(conn, node, multiplier)
+    added = 0
+    for chunk in features.read_features(conn, node, threshold, start, end):
+        pixels, spots = chunk['table'].active_pixels(), chunk['table'].counts()
+        keep = spots > 0
+        rows = zip(chunk['Datetime'][keep].tolist(), pixels[keep].tolist(), spots[keep].tolist())
+        conn.executemany("REPLACE INTO training (Times, Pixels, Hotspots) VALUES (?, ?, ?)", rows)
+        added += int(keep.sum())
+    conn.commit()
+    return added
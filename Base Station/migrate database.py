@@ -0,0 +1,59 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              occupancy database migration
+#   Version:            1
+#
+#   Description:
+#       One shot upgrade for databases written by older versions of the collector.
+#       Converts the comma joined Grideye text of each frame into the binary Frame column
+#       and clears the text so the file can shrink. Rows are converted in chunks and each
+#       chunk is its own transaction, so the script can be stopped and rerun safely.
+#       Rows from before the Epoch column get their Datetime text converted into it the same way.
+#
+#       Usage: python "migrate database.py" [path to occupancy.db]
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy
+
+import sys
+import storage
+
+CHUNK = 5000
+
+path = sys.argv[1] if len(sys.argv) > 1 else 'occupancy.db'
+conn = storage.connect(path)
+c = conn.cursor()
+
+storage.prepare_data(conn)
+
+# move grideye text into the Frame column
+converted = 0
+while True:
+    c.execute('SELECT rowid, Grideye FROM data WHERE Frame IS NULL AND Grideye IS NOT NULL LIMIT ?', (CHUNK,))
+    rows = c.fetchall()
+    if not rows:
+        break
+    frames = storage.decode_frames([(None, i[1]) for i in rows])
+    with conn:
+        conn.executemany('UPDATE data SET Frame = ?, Grideye = NULL WHERE rowid = ?',
+                         [(storage.encode_frame(frames[idx]), i[0]) for idx, i in enumerate(rows)])
+    converted += len(rows)
+    print('{} frames converted'.format(converted))
+
+print('grideye migration complete, {} frames converted'.format(converted))
+
+# integer timestamps for rows written before the collector stored them
+filled = storage.backfill_epochs(conn, CHUNK)
+print('epoch migration complete, {} rows filled'.format(filled))
+
+# give the space used by the old text back to the file system
+if converted:
+    print('vacuuming database...')
+    conn.execute('VACUUM')
+conn.close()
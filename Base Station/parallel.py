@@ -0,0 +1,128 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Parallel traffic analysis
+#   Version:            1
+#
+#   Description:
+#       Runs the hotspot detection and blob tracking of "traffic algorithm.py" over many nodes and
+#       long date ranges on every core. Work is split by node, then by time window, and each
+#       window is tracked in its own process straight from the database, with hotspots from the
+#       feature cache (features.py) where frames have been labelled with the same threshold before.
+#
+#       A blob can only be open across a frame that has a hotspot in it, so a frame without any
+#       leaves the tracker empty no matter what came before. Windows are stitched at those frames:
+#       each one starts tracking after the first empty frame at or after its start, and runs past
+#       its end (the overlap) until the next empty frame, where every blob it was following has
+#       closed. The windows together see every frame exactly once with the same tracker state as
+#       a single TrafficTracker fed the whole range, so the blobs come out the same, in the same order.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy, scipy
+
+import multiprocessing
+import os
+import sqlite3
+import numpy as np
+import features
+import storage
+from tracking import TrafficTracker, HISTORY
+
+WINDOW = 6 * 3600  # seconds of data per task
+
+
+def track_window(path, node, threshold, start, stop, end, synced, history=HISTORY):
+    # tracks the frames of one node from Epoch start on and returns the blobs that finished, as (node, blob)
+    # in the order they closed. Unless synced (the first window of a range), frames up to and including the
+    # first one without hotspots are skipped. Tracking stops after the first frame without hotspots at or
+    # after stop, or at end (None for the end of the data) where the blobs still open are closed.
+    tracker = TrafficTracker({node: threshold}, history)
+    finished = []
+    conn = sqlite3.connect(path, timeout=60)  # other workers may be writing to the feature cache
+    try:
+        for chunk in features.read_features(conn, node, threshold, start, end):
+            times, table = chunk['Epoch'], chunk['table']
+            quiet = table.counts() == 0
+            begin = 0
+            if not synced:
+                empty = np.flatnonzero(quiet)
+                if not len(empty):
+                    continue
+                if times[empty[0]] >= stop:
+                    # the previous window's overlap already covers this window
+                    return finished
+                synced = True
+                begin = empty[0] + 1
+            done = np.flatnonzero(quiet[begin:] & (times[begin:] >= stop))
+            if len(done):
+                last = begin + done[0] + 1
+                finished.extend(tracker.feed_table(node, times[begin:last].tolist(), table.slice(begin, last)))
+                return finished
+            finished.extend(tracker.feed_table(node, times[begin:].tolist(), table.slice(begin, table.count)))
+        finished.extend(tracker.close())
+        return finished
+    finally:
+        conn.close()
+
+
+def windows(conn, node, start=None, end=None, window=WINDOW):
+    # (start, stop) Epoch pairs covering the node's frames between start and end, window seconds each
+    where, params = storage.data_filter(node, start, end)
+    first, last = conn.execute('SELECT min(Epoch), max(Epoch) FROM data' + where, params).fetchone()
+    if first is None:
+        return []
+    step = int(window * 1e6)
+    bounds = list(range(first, last + 1, step)) + [last + 1]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def analyze(path, thresholds, nodes=None, start=None, end=None, window=WINDOW, processes=None, history=HISTORY,
+            sink=None):
+    # track every node with a threshold (or just nodes) between start and end (anything
+    # storage.to_epoch_bound() takes, None for no limit) in a pool of processes (all cores if None).
+    # Finished blobs go to sink(node, blob) node by node in the order they closed, the same as a
+    # TrafficTracker fed the whole range would hand them over. Without a sink they're returned as (node, blob).
+    conn = sqlite3.connect(path)
+    # so the workers only have feature rows to write
+    storage.prepare_data(conn)
+    storage.backfill_epochs(conn)
+    features.create_table(conn)
+    end_epoch = None if end is None else storage.to_epoch_bound(end)
+    tasks = []
+    for node in sorted(thresholds) if nodes is None else nodes:
+        if node not in thresholds:
+            continue
+        for idx, (first, stop) in enumerate(windows(conn, node, start, end, window)):
+            tasks.append((path, node, thresholds[node], first, stop, end_epoch, idx == 0, history))
+    conn.close()
+
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        # the analysis scripts run at module level and would be rerun by every spawned worker
+        processes = 1
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if processes == 1 or len(tasks) <= 1:
+        return deliver(map(run_task, tasks), sink)
+    with multiprocessing.get_context('fork').Pool(min(processes, len(tasks))) as pool:
+        return deliver(pool.imap(run_task, tasks), sink)
+
+
+def run_task(task):
+    return track_window(*task)
+
+
+def deliver(results, sink):
+    # results come in task order, node by node and window by window
+    finished = []
+    for blobs in results:
+        if sink is None:
+            finished.extend(blobs)
+        else:
+            for node, blob in blobs:
+                sink(node, blob)
+    return finished
@@ -0,0 +1,177 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Sensor node polling scheduler
+#   Version:            1
+#
+#   Description:
+#       Keeps a registry of the sensor nodes on the network, keyed by their 64 bit Xbee address,
+#       and decides when each one needs a data request. Requests are unicast and acknowledged by
+#       the coordinator, so a node that doesn't answer is retried, then backed off and rediscovered
+#       on its own while every other node keeps streaming.
+#
+#       The scheduler never touches the serial port. Packets go out through the send function it
+#       is given, responses come in through handle_response() and saw_data(), and tick() is called
+#       regularly to act on deadlines.
+#
+#   Dependencies:
+#       Python 3.5.1
+
+from xbee import remote_at, BROADCAST
+
+SERIAL_LOW = b'SL'   # AT command answered with the lower half of a node's address, used for discovery
+REQUEST_PIN = b'D1'  # AT command for the pin wired to the launchpad's request interrupt
+PIN_LOW = b'\x04'
+PIN_HIGH = b'\x05'
+STATUS_OK = 0
+
+# node states
+REQUESTING = 'requesting'  # needs a data request
+ARMING = 'arming'          # request pin pulled low, waiting a moment before pulling it high
+WAITING = 'waiting'        # request sent, waiting for the coordinator to acknowledge it
+STREAMING = 'streaming'    # node acknowledged the request and is sending data
+LOST = 'lost'              # node stopped answering, waiting out its backoff
+PROBING = 'probing'        # rediscovery sent to a lost node, waiting for an answer
+
+
+class Node:
+    def __init__(self, address, now):
+        self.address = address  # 64 bit address as bytes
+        self.state = REQUESTING
+        self.deadline = now
+        self.retries = 0
+        self.backoff = 0.
+        self.last_data = now
+        self.frames = 0
+
+    def serial_low(self):
+        return self.address[4:]
+
+
+class PollScheduler:
+    def __init__(self, send, ack_timeout=5., retries=3, request_timeout=350., backoff=10., max_backoff=600.,
+                 discovery_interval=600., arm_delay=0.1):
+        self.send = send
+        self.ack_timeout = ack_timeout          # seconds to wait for the coordinator to acknowledge a request
+        self.retries = retries                  # requests sent to a node before it's considered lost
+        self.request_timeout = request_timeout  # request data again from a node silent for this long
+        self.min_backoff = backoff
+        self.max_backoff = max_backoff
+        self.discovery_interval = discovery_interval  # broadcast discovery to pick up new nodes
+        self.arm_delay = arm_delay
+        self.nodes = {}    # address -> Node
+        self.pending = {}  # frame id -> address of the node an acknowledged command was sent to
+        self.next_id = 1
+        self.next_discovery = None
+
+    def frame_id(self, address):
+        # frame ids 1-255 are reused in turn, 0 would tell the coordinator not to answer
+        fid = self.next_id
+        self.next_id = fid % 255 + 1
+        self.pending[fid] = address
+        return fid
+
+    def add(self, address, now):
+        # register a node, nodes already known are left alone
+        node = self.nodes.get(address)
+        if node is None:
+            node = self.nodes[address] = Node(address, now)
+            print('node discovered. address:{0}'.format(address.hex()))
+        return node
+
+    def discover(self, now):
+        # broadcast for the serial numbers of every node on the network, replies come back as
+        # remote AT responses from each node
+        self.send(remote_at(BROADCAST, SERIAL_LOW, frame_id=self.frame_id(BROADCAST)))
+        self.next_discovery = now + self.discovery_interval
+
+    def failed(self, node, now):
+        node.retries += 1
+        if node.retries < self.retries:
+            node.state = REQUESTING
+            node.deadline = now
+        else:
+            node.backoff = min(max(node.backoff * 2, self.min_backoff), self.max_backoff)
+            node.state = LOST
+            node.deadline = now + node.backoff
+            print('node {0} is not responding, retrying in {1:.0f}s'.format(node.address.hex(), node.backoff))
+
+    def handle_response(self, frame, now):
+        # frame is a REMOTE_AT_RESPONSE: type, frame id, 64 bit address, 16 bit address, command, status, data
+        address = self.pending.pop(frame[1], None)
+        source = bytes(frame[2:10])
+        command = bytes(frame[12:14]).upper()
+        status = frame[14]
+        if address == BROADCAST:
+            # discovery broadcasts get one answer per node, keep the id for the rest of them
+            self.pending[frame[1]] = BROADCAST
+        if status != STATUS_OK:
+            if source in self.nodes and address == source:
+                self.failed(self.nodes[source], now)
+            return
+        node = self.add(source, now)
+        if command == SERIAL_LOW and node.state == PROBING:
+            # a lost node answered its rediscovery, ask it for data again
+            node.state = REQUESTING
+            node.deadline = now
+            node.retries = 0
+        elif command == REQUEST_PIN and node.state == WAITING:
+            node.state = STREAMING
+            node.retries = 0
+            node.backoff = 0.
+            node.last_data = now
+
+    def saw_data(self, address, now):
+        # a data or background frame arrived from this node
+        node = self.add(address, now)
+        node.last_data = now
+        node.frames += 1
+        if node.state != STREAMING:
+            node.state = STREAMING
+            node.retries = 0
+            node.backoff = 0.
+
+    def tick(self, now):
+        # send whatever is due
+        if self.next_discovery is None or now >= self.next_discovery:
+            self.discover(now)
+        for node in self.nodes.values():
+            if node.state == STREAMING:
+                if now - node.last_data >= self.request_timeout:
+                    node.state = REQUESTING
+                    node.deadline = now
+                else:
+                    continue
+            if now < node.deadline:
+                continue
+            if node.state == REQUESTING:
+                # pull the request pin low, then high after arm_delay, the launchpad starts sending on the rising edge
+                self.send(remote_at(node.address, REQUEST_PIN, PIN_LOW))
+                node.state = ARMING
+                node.deadline = now + self.arm_delay
+            elif node.state == ARMING:
+                self.send(remote_at(node.address, REQUEST_PIN, PIN_HIGH, self.frame_id(node.address)))
+                node.state = WAITING
+                node.deadline = now + self.ack_timeout
+            elif node.state == WAITING:
+                self.failed(node, now)
+            elif node.state == LOST:
+                self.send(remote_at(node.address, SERIAL_LOW, frame_id=self.frame_id(node.address)))
+                node.state = PROBING
+                node.deadline = now + self.ack_timeout
+            elif node.state == PROBING:
+                node.backoff = min(node.backoff * 2, self.max_backoff)
+                node.state = LOST
+                node.deadline = now + node.backoff
+
+    def summary(self):
+        # number of nodes in each state
+        counts = {}
+        for node in self.nodes.values():
+            counts[node.state] = counts.get(node.state, 0) + 1
+        return counts
@@ -0,0 +1,232 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Simulated Xbee coordinator
+#   Version:            1
+#
+#   Description:
+#       Stands in for the Xbee coordinator and the sensor nodes behind it so the collector can be
+#       load tested without hardware. It answers discovery and data requests the way the real
+#       network does and sends the same API frames the launchpads do (see send_data_packet,
+#       inactive_bg and active_bg in occV1-5-1.c): 0x97 remote AT responses, and 0x90 receive
+#       packets carrying data, inactive background (0xDF) and active background (0xEF) payloads.
+#
+#       Frames are replayed from an existing occupancy database or synthesized (a flat background
+#       with a warm blob walking across it). Bytes can be corrupted, frames dropped and whole nodes
+#       taken offline for a while to exercise the collector's recovery.
+#
+#       Run it, then point the collector at the pseudo terminal it prints:
+#           python simulator.py --nodes 16 --fps 10
+#           python "data collecter.py" /dev/pts/N sim.db
+#       The pseudo terminal needs a POSIX system (Linux/Raspbian), Simulator itself runs anywhere.
+#
+#   Dependencies:
+#       Python 3.5.1, numpy, sqlite3
+
+import argparse
+import os
+import random
+import select
+import sqlite3
+import time
+import numpy as np
+import storage
+from xbee import FrameDecoder, api_frame, BROADCAST, SERIAL_HIGH, REMOTE_AT_REQUEST, REMOTE_AT_RESPONSE, RX_PACKET
+
+STATUS_OK = 0
+STATUS_TX_FAILURE = 4
+PIN_LOW = 0x04
+PIN_HIGH = 0x05
+
+
+def synthetic_frames(count, seed=0):
+    # raw grideye payloads: about 22 C with some noise and a 30 C blob walking diagonally across the grid
+    rng = np.random.RandomState(seed)
+    frames = 22. + rng.normal(0, 0.3, (count, 8, 8))
+    rows, cols = np.mgrid[0:8, 0:8]
+    for i in range(count):
+        step = i % 24
+        if step < 12:  # someone walks through for 12 frames, then the room is empty for 12
+            r = c = step * 7 / 11.
+            frames[i] += 8 * np.exp(-((rows - r) ** 2 + (cols - c) ** 2) / 2.)
+    return [storage.encode_frame(f) for f in frames]
+
+
+def recorded_frames(path, node=None, limit=10000):
+    # raw grideye payloads from an occupancy database, in either storage layout
+    conn = sqlite3.connect(path)
+    if node is None:
+        rows = conn.execute('SELECT ' + storage.FRAME_COLUMNS + ' FROM data LIMIT ?', (limit,)).fetchall()
+    else:
+        rows = conn.execute('SELECT ' + storage.FRAME_COLUMNS + ' FROM data WHERE Node = ? LIMIT ?',
+                            (node, limit)).fetchall()
+    conn.close()
+    return [i[0] if i[0] is not None else storage.encode_frame(storage.decode_frames([i])[0]) for i in rows]
+
+
+class SimNode:
+    def __init__(self, number, frames, fps, bg_interval):
+        self.number = number
+        self.address = SERIAL_HIGH + bytes([0x40, 0x00, number >> 8, number & 0xFF])
+        self.frames = frames
+        self.position = random.randrange(len(frames))
+        self.period = 1. / fps
+        self.bg_interval = bg_interval
+        self.streaming = False
+        self.next_frame = 0.
+        self.next_bg = 0.
+        self.offline_until = 0.
+
+    def rx_packet(self, rf_data):
+        # what the coordinator hands the base station when this node transmits rf_data
+        return api_frame([RX_PACKET] + list(self.address) + [0xFF, 0xFE, 0x01] + list(rf_data))
+
+    def data_packet(self):
+        grid = self.frames[self.position]
+        self.position = (self.position + 1) % len(self.frames)
+        # node, co2 duty cycle, humidity and temperature in tenths, pir, grideye, terminators
+        rf = bytes([self.number & 0xFF, 2, 0x01, 0xC2, 0x00, 0xFA, 1]) + grid + bytes([0xDF, 0xDF])
+        return self.rx_packet(rf)
+
+    def background_packet(self, active):
+        grid = self.frames[self.position]
+        rf = bytes([0xEF if active else 0xDF, self.number & 0xFF, 1 if active else 0]) + grid
+        return self.rx_packet(rf)
+
+
+class Simulator:
+    # everything except the serial port: handle() takes the frame data of a request from the
+    # collector, due() returns the packets the network would have sent by time now
+    def __init__(self, frames, nodes=4, fps=1., bg_interval=900., corrupt=0., drop=0., outage=0.,
+                 outage_time=30., seed=None):
+        self.rng = random.Random(seed)
+        self.nodes = {}
+        for n in range(1, nodes + 1):
+            node = SimNode(n, frames, fps, bg_interval)
+            self.nodes[node.address] = node
+        self.corrupt = corrupt      # chance of flipping a byte in a packet
+        self.drop = drop            # chance of a packet never arriving
+        self.outage = outage        # chance per second of a node going offline
+        self.outage_time = outage_time
+        self.sent = 0
+        self.bytes = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.out = []
+
+    def respond(self, frame_id, node, command, status, data=b''):
+        if frame_id:
+            self.out.append(api_frame([REMOTE_AT_RESPONSE, frame_id] + list(node.address) + [0xFF, 0xFE] +
+                                      list(command) + [status] + list(data)))
+
+    def handle(self, frame, now):
+        # frame is a REMOTE_AT_REQUEST: type, frame id, 64 bit address, 16 bit address, options, command, parameter
+        if frame[0] != REMOTE_AT_REQUEST:
+            return
+        frame_id = frame[1]
+        address = bytes(frame[2:10])
+        command = bytes(frame[13:15])
+        parameter = bytes(frame[15:])
+        targets = list(self.nodes.values()) if address == BROADCAST else [self.nodes.get(address)]
+        for node in targets:
+            if node is None:
+                continue
+            if now < node.offline_until:
+                if address != BROADCAST:
+                    self.respond(frame_id, node, command, STATUS_TX_FAILURE)
+                continue
+            if command.upper() == b'SL':
+                self.respond(frame_id, node, command, STATUS_OK, node.address[4:])
+            elif command.upper() == b'D1' and parameter:
+                if parameter[0] == PIN_HIGH and not node.streaming:
+                    node.streaming = True
+                    node.next_frame = now + node.period
+                    node.next_bg = now + node.bg_interval
+                elif parameter[0] == PIN_LOW:
+                    node.streaming = False
+                self.respond(frame_id, node, command, STATUS_OK)
+
+    def due(self, now, elapsed):
+        # packets the nodes send between the last call and now, elapsed is the time since the last call
+        for node in self.nodes.values():
+            if self.outage and now >= node.offline_until and self.rng.random() < self.outage * elapsed:
+                # the node loses power and forgets it was asked for data
+                node.offline_until = now + self.outage_time
+                node.streaming = False
+            if not node.streaming:
+                continue
+            while node.next_frame <= now:
+                self.out.append(node.data_packet())
+                node.next_frame += node.period
+            if node.next_bg <= now:
+                self.out.append(node.background_packet(self.rng.random() < 0.5))
+                node.next_bg += node.bg_interval
+        out, self.out = self.out, []
+        packets = []
+        for packet in out:
+            if self.drop and self.rng.random() < self.drop:
+                self.dropped += 1
+                continue
+            if self.corrupt and self.rng.random() < self.corrupt:
+                packet = bytearray(packet)
+                packet[self.rng.randrange(len(packet))] ^= 1 << self.rng.randrange(8)
+                self.corrupted += 1
+            packets.append(bytes(packet))
+        self.sent += len(packets)
+        self.bytes += sum(len(i) for i in packets)
+        return packets
+
+
+def open_pty():
+    # returns (master fd, path of the terminal to give the collector)
+    import tty  # POSIX only
+    master, slave = os.openpty()
+    tty.setraw(slave)
+    return master, os.ttyname(slave)
+
+
+def run(sim, master, tick=0.01, duration=None):
+    # shuttle bytes between the simulator and the pseudo terminal until duration runs out
+    requests = FrameDecoder(None, frame_types=(REMOTE_AT_REQUEST,))
+    start = last = time.monotonic()
+    while duration is None or last - start < duration:
+        readable, _, _ = select.select([master], [], [], tick)
+        now = time.monotonic()
+        if readable:
+            requests.feed(os.read(master, requests.space()))
+            for frame in requests.frames():
+                sim.handle(frame, now)
+        for packet in sim.due(now, now - last):
+            os.write(master, packet)
+        last = now
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulated Xbee coordinator and sensor nodes')
+    parser.add_argument('--nodes', type=int, default=4, help='number of sensor nodes')
+    parser.add_argument('--fps', type=float, default=1., help='frames per second from each node (grideye: 1 or 10)')
+    parser.add_argument('--replay', metavar='DB', help='replay frames recorded in this occupancy database')
+    parser.add_argument('--bg-interval', type=float, default=900., help='seconds between background packets')
+    parser.add_argument('--corrupt', type=float, default=0., help='chance of a corrupted byte in a packet')
+    parser.add_argument('--drop', type=float, default=0., help='chance of a packet being lost')
+    parser.add_argument('--outage', type=float, default=0., help='chance per second of a node dropping out')
+    parser.add_argument('--outage-time', type=float, default=30., help='seconds a dropped out node stays down')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    args = parser.parse_args()
+
+    frames = recorded_frames(args.replay) if args.replay else synthetic_frames(240)
+    sim = Simulator(frames, args.nodes, args.fps, args.bg_interval, args.corrupt, args.drop, args.outage,
+                    args.outage_time)
+    master, path = open_pty()
+    print('simulating {} nodes at {} fps on {}'.format(args.nodes, args.fps, path))
+    try:
+        run(sim, master, duration=args.duration)
+    except KeyboardInterrupt:
+        pass
+    print('sent {} packets ({} bytes), {} dropped, {} corrupted'.format(sim.sent, sim.bytes, sim.dropped,
+                                                                          sim.corrupted))
@@ -0,0 +1,315 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Occupancy database helpers
+#   Version:            1
+#
+#   Description:
+#       Shared code for reading and writing the occupancy database.
+#       BatchWriter buffers rows from the collector and writes them in one transaction
+#       once enough rows are waiting or the oldest row has waited long enough, so the SD card
+#       on the Pi sees one sync per batch instead of one per frame.
+#       Grideye frames are stored in the Frame column as the raw 128 byte sensor payload
+#       (64 big endian 12 bit values, 0.25 C per count). decode_frames() turns query results
+#       into an (N, 8, 8) array and still understands the old comma joined Grideye text.
+#       read_frames() streams a node and date range out of the data table in numpy chunks
+#       with one query, so the analysis scripts never hold the whole range in memory.
+#       Every data row carries its time twice: Datetime as text for people and Epoch as integer
+#       microseconds since 1970 (same local clock) for indexing, range queries and numpy
+#       datetime64 arrays. parse_times() converts Datetime text for rows and tables without Epoch.
+#       BlobStore saves tracked blobs as one row of summary values in the blobs table and one row per
+#       reading in blob_readings, so their paths can be queried in SQL.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy
+
+import datetime
+import sqlite3
+import time
+import numpy as np
+
+FRAME_DTYPE = np.dtype('>u2')  # grideye pixel registers as they come off the wire
+FRAME_SCALE = 0.25             # degrees C per count
+FRAME_BYTES = 128
+FRAME_COLUMNS = 'Frame, Grideye'  # select these and pass the rows to decode_frames()
+ARRAYSIZE = 2000                  # rows per chunk from read_frames()
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S:%f'  # Datetime text, note the colon before the microseconds
+EPOCH = datetime.datetime(1970, 1, 1)
+MICROSECOND = datetime.timedelta(microseconds=1)
+DATA_INDEX = 'CREATE INDEX IF NOT EXISTS data_node_epoch ON data (Node, Epoch)'
+# rows from before the Epoch column, so finding what still needs a backfill doesn't scan the table
+MISSING_EPOCH_INDEX = 'CREATE INDEX IF NOT EXISTS data_missing_epoch ON data (Datetime) WHERE Epoch IS NULL'
+
+
+def connect(path='occupancy.db', **kwargs):
+    # open the database in WAL mode. With WAL, synchronous=NORMAL only syncs at checkpoints, a power
+    # cut can lose the last few transactions but never corrupts the database
+    # extra keyword arguments go to sqlite3.connect
+    conn = sqlite3.connect(path, **kwargs)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def ensure_column(conn, table, column, decl):
+    # add a column to a table created by an older version of the scripts
+    if column not in [i[1] for i in conn.execute('PRAGMA table_info({})'.format(table))]:
+        conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, column, decl))
+
+
+def prepare_data(conn):
+    # bring the data table of any version up to date: Frame and Epoch columns and their indexes
+    ensure_column(conn, 'data', 'Frame', 'blob')  # databases from before v6.5 only have Grideye text
+    ensure_column(conn, 'data', 'Epoch', 'integer')
+    conn.execute('DROP INDEX IF EXISTS data_node_time')  # (Node, Datetime), replaced by DATA_INDEX
+    conn.execute(DATA_INDEX)
+    conn.execute(MISSING_EPOCH_INDEX)
+
+
+def to_epoch(when):
+    # datetime to integer microseconds since 1970, the Epoch column
+    return (when - EPOCH) // MICROSECOND
+
+
+def from_epoch(epoch):
+    # Epoch value to datetime
+    return EPOCH + datetime.timedelta(microseconds=int(epoch))
+
+
+def parse_times(texts):
+    # Datetime text (TIME_FORMAT) to a datetime64[us] array in one numpy call instead of a strptime per row
+    # .astype(np.int64) on the result gives Epoch values
+    raw = np.array(texts, dtype='S26')
+    raw.view(np.uint8).reshape((len(raw), 26))[:, 19] = ord('.')  # ISO 8601 wants a dot before the fraction
+    return raw.astype('datetime64[us]')
+
+
+def to_epoch_bound(value):
+    # a read_frames() start or end: Datetime text, an ISO date like '2017-11-15T11:00', a datetime,
+    # a numpy datetime64 or an Epoch value
+    if isinstance(value, str):
+        if len(value) == 26 and value[19] == ':':
+            return int(parse_times([value])[0].astype(np.int64))
+        return int(np.datetime64(value, 'us').astype(np.int64))
+    if isinstance(value, datetime.datetime):
+        return to_epoch(value)
+    if isinstance(value, np.datetime64):
+        return int(value.astype('datetime64[us]').astype(np.int64))
+    return int(value)
+
+
+def backfill_epochs(conn, chunk=5000):
+    # fill in Epoch for rows written before the collector stored it, each chunk in its own transaction
+    # returns the number of rows filled
+    filled = 0
+    while True:
+        rows = conn.execute('SELECT rowid, Datetime FROM data WHERE Epoch IS NULL AND Datetime IS NOT NULL'
+                            ' LIMIT ?', (chunk,)).fetchall()
+        if not rows:
+            return filled
+        epochs = parse_times([i[1] for i in rows]).astype(np.int64).tolist()
+        with conn:
+            conn.executemany('UPDATE data SET Epoch = ? WHERE rowid = ?', zip(epochs, (i[0] for i in rows)))
+        filled += len(rows)
+
+
+def encode_frame(temps):
+    # pack 64 temperatures in C into the Frame column format (only used for old text rows,
+    # the collector stores the payload bytes straight off the wire)
+    counts = np.rint(np.asarray(temps, dtype=np.float64).reshape(64) / FRAME_SCALE)
+    return counts.astype(FRAME_DTYPE).tobytes()
+
+
+def decode_frame(payload):
+    # turn one 128 byte grideye payload (bytes or memoryview) into an 8x8 float32 array in C
+    # nothing is shared between calls, so frames can be decoded on any thread
+    frame = np.frombuffer(payload, dtype=FRAME_DTYPE, count=64).astype(np.float32)
+    frame *= FRAME_SCALE
+    return frame.reshape((8, 8))
+
+
+def decode_frames(rows):
+    # rows are (Frame, Grideye) pairs, returns an (N, 8, 8) float32 array of temperatures in C
+    # frames stored as blobs are decoded in one numpy call, old text rows are parsed one at a time
+    rows = list(rows)
+    if not rows:
+        return np.empty((0, 8, 8), dtype=np.float32)
+    blobs = [i[0] for i in rows]
+    if None not in blobs:
+        frames = np.frombuffer(b''.join(blobs), dtype=FRAME_DTYPE).astype(np.float32)
+    else:
+        frames = np.empty((len(rows), 64), dtype=np.float32)
+        for idx, (blob, text) in enumerate(rows):
+            if blob is not None:
+                frames[idx] = np.frombuffer(blob, dtype=FRAME_DTYPE)
+            else:
+                frames[idx] = np.array(text.split(','), dtype=np.float32) / FRAME_SCALE
+    frames *= FRAME_SCALE
+    return frames.reshape((len(rows), 8, 8))
+
+
+def data_filter(node=None, start=None, end=None, table='data'):
+    # WHERE clause (empty if there are no limits) and parameters picking a node and range out of the data table
+    where = []
+    params = []
+    if node is not None:
+        where.append(table + '.Node = ?')
+        params.append(node)
+    if start is not None:
+        where.append(table + '.Epoch >= ?')
+        params.append(to_epoch_bound(start))
+    if end is not None:
+        where.append(table + '.Epoch <= ?')
+        params.append(to_epoch_bound(end))
+    return (' WHERE ' + ' AND '.join(where) if where else ''), params
+
+
+def read_frames(conn, node=None, start=None, end=None, columns=(), arraysize=ARRAYSIZE, frames=True):
+    # yields the data rows of one node (every node if None) between start and end (no limit if None),
+    # ordered by node then time, arraysize rows at a time. start and end can be anything to_epoch_bound() takes.
+    # Each chunk is a dict of numpy arrays: 'Node', 'Datetime', 'Epoch', 'frames' (an (N, 8, 8) array of
+    # temperatures, left out if frames is False) and one for each name in columns.
+    # Rows without an Epoch yet are backfilled first.
+    prepare_data(conn)
+    backfill_epochs(conn)
+    where, params = data_filter(node, start, end)
+    sql = 'SELECT Node, Datetime, Epoch, ' + (FRAME_COLUMNS if frames else 'NULL, NULL')
+    sql += ''.join(', ' + i for i in columns) + ' FROM data' + where + ' ORDER BY Node, Epoch'
+
+    c = conn.cursor()
+    c.arraysize = arraysize
+    c.execute(sql, params)
+    while True:
+        rows = c.fetchmany()
+        if not rows:
+            break
+        fields = list(zip(*rows))
+        chunk = {'Node': np.array(fields[0]), 'Datetime': np.array(fields[1]),
+                 'Epoch': np.array(fields[2], dtype=np.int64)}
+        if frames:
+            chunk['frames'] = decode_frames(zip(fields[3], fields[4]))
+        for idx, name in enumerate(columns):
+            chunk[name] = np.array(fields[5 + idx])
+        yield chunk
+
+
+class BatchWriter:
+    # Buffers (statement, row) pairs and writes them with executemany inside one transaction.
+    # A flush happens when max_rows are waiting or the oldest row is max_delay seconds old,
+    # whichever comes first. Rows are written in the order they were added.
+
+    def __init__(self, conn, max_rows=50, max_delay=5.0):
+        self.conn = conn
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.runs = []  # [statement, [rows]] for each run of rows sharing a statement
+        self.pending = 0
+        self.oldest = None  # time.monotonic() of the first row waiting to be written
+
+    def add(self, sql, row):
+        if self.runs and self.runs[-1][0] == sql:
+            self.runs[-1][1].append(row)
+        else:
+            self.runs.append([sql, [row]])
+        if not self.pending:
+            self.oldest = time.monotonic()
+        self.pending += 1
+        if self.pending >= self.max_rows:
+            self.flush()
+
+    def time_left(self):
+        # seconds until the buffered rows are due, None if nothing is buffered
+        if not self.pending:
+            return None
+        return max(0., self.oldest + self.max_delay - time.monotonic())
+
+    def poll(self):
+        # flush if the oldest buffered row has hit its deadline
+        if self.pending and self.time_left() == 0:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        with self.conn:  # one transaction, rolled back if any statement fails
+            for sql, rows in self.runs:
+                self.conn.executemany(sql, rows)
+        self.runs = []
+        self.pending = 0
+        self.oldest = None
+
+
+BLOB_INSERT = ("INSERT INTO blobs"
+               " (Id, Node, TimeStart, TimeEnd, StartEpoch, EndEpoch, Readings, Duration, AvgSize, MinSize,"
+               " MaxSize, AvgTemp, Displacement, AvgBearing, AvgVelocity)"
+               " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+READING_INSERT = ("INSERT INTO blob_readings"
+                  " (Blob, Reading, Epoch, Row, Col, Bearing, Velocity, PredRow, PredCol)"
+                  " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def create_blob_tables(conn):
+    # blobs: one row per tracked blob. blob_readings: one row per reading of a blob, numbered from 0, with
+    # where it was, its bearing and velocity since the first reading (NULL for the first) and where the
+    # tracker expected it next. Per reading values only go back as far as the tracker's history.
+    columns = [i[1] for i in conn.execute('PRAGMA table_info(blobs)')]
+    if columns and 'Id' not in columns:
+        # the old layout with comma joined text per reading, kept as it was
+        conn.execute('ALTER TABLE blobs RENAME TO blobs_text')
+    conn.execute("CREATE TABLE IF NOT EXISTS blobs"
+                 " (Id integer PRIMARY KEY, Node integer, TimeStart text, TimeEnd text, StartEpoch integer,"
+                 " EndEpoch integer, Readings integer, Duration real, AvgSize real, MinSize integer,"
+                 " MaxSize integer, AvgTemp real, Displacement real, AvgBearing real, AvgVelocity real)")
+    conn.execute("CREATE TABLE IF NOT EXISTS blob_readings"
+                 " (Blob integer, Reading integer, Epoch integer, Row real, Col real, Bearing real,"
+                 " Velocity real, PredRow real, PredCol real, PRIMARY KEY (Blob, Reading))")
+    conn.execute('CREATE INDEX IF NOT EXISTS blobs_start ON blobs (StartEpoch, Readings)')
+    conn.execute('CREATE INDEX IF NOT EXISTS blobs_readings ON blobs (Readings)')
+
+
+class BlobStore:
+    # Buffers finished blobs (tracking.Region) and writes them with executemany, the summaries and their
+    # readings in one transaction, once max_rows readings are waiting and when flushed.
+
+    def __init__(self, conn, max_rows=ARRAYSIZE):
+        self.conn = conn
+        self.max_rows = max_rows
+        create_blob_tables(conn)
+        self.next_id = conn.execute('SELECT coalesce(max(Id), 0) + 1 FROM blobs').fetchone()[0]
+        self.blobs = []
+        self.readings = []
+
+    def add(self, node, blob):
+        ident = self.next_id
+        self.next_id += 1
+        self.blobs.append((ident, int(node), from_epoch(blob.start_time).strftime(TIME_FORMAT),
+                           from_epoch(blob.end_time).strftime(TIME_FORMAT), int(blob.start_time),
+                           int(blob.end_time), blob.readings, blob.duration, blob.avg_s, blob.min_s, blob.max_s,
+                           float(blob.avg_temp), blob.displacement, blob.avg_bearing(), blob.avg_velocity()))
+        # the histories hold the last len(...) readings, bearing and velocity start at the second reading
+        first = blob.readings - len(blob.times)
+        moves = blob.readings - len(blob.bearing)
+        bearing = list(blob.bearing)
+        velocity = list(blob.velocity)
+        for idx, (time, center, pred) in enumerate(zip(blob.times, blob.center, blob.prediction)):
+            reading = first + idx
+            move = reading - moves
+            self.readings.append((ident, reading, int(time), float(center[0]), float(center[1]),
+                                  float(bearing[move]) if move >= 0 else None,
+                                  float(velocity[move]) if move >= 0 else None, float(pred[0]), float(pred[1])))
+        if len(self.readings) >= self.max_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.blobs:
+            return
+        with self.conn:  # one transaction, rolled back if any statement fails
+            self.conn.executemany(BLOB_INSERT, self.blobs)
+            self.conn.executemany(READING_INSERT, self.readings)
+        self.blobs = []
+        self.readings = []
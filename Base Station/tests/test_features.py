@@ -0,0 +1,66 @@
+import os
+import sqlite3
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import collection  # the Base Station modules import each other by name
+import features
+import storage
+
+EPOCH = 1510743600000000  # 2017-11-15T11:00:00
+
+
+def make_db(frames=20):
+    conn = sqlite3.connect(':memory:')
+    collection.create_tables(conn)
+    temps = np.full(64, 20.)
+    temps[27] = 30.
+    rows = []
+    for i in range(frames):
+        epoch = EPOCH + i * 100000
+        rows.append((1, storage.from_epoch(epoch).strftime(storage.TIME_FORMAT), epoch, storage.encode_frame(temps),
+                     0, 0, 0, 0, 0))
+    conn.executemany(collection.DATA_INSERT, rows)
+    conn.commit()
+    return conn
+
+
+def read_all(conn, threshold):
+    return sum(chunk['table'].count for chunk in features.read_features(conn, 1, threshold))
+
+
+def stored_params(conn):
+    return set(i[0] for i in conn.execute('SELECT DISTINCT Params FROM features'))
+
+
+def test_superseded_sets_are_deleted():
+    conn = make_db()
+    thresholds = [np.full((8, 8), 25. + i) for i in range(features.MAX_PARAMS + 2)]
+    for threshold in thresholds:
+        assert read_all(conn, threshold) == 20
+    kept = set(features.params_key(i) for i in thresholds[-features.MAX_PARAMS:])
+    assert stored_params(conn) == kept
+    assert set(i[0] for i in conn.execute('SELECT Params FROM features_params')) == kept
+    assert conn.execute('SELECT count(*) FROM features').fetchone()[0] == 20 * features.MAX_PARAMS
+
+
+def test_reused_set_is_kept():
+    conn = make_db()
+    thresholds = [np.full((8, 8), 25. + i) for i in range(features.MAX_PARAMS + 1)]
+    for threshold in thresholds[:-1]:
+        read_all(conn, threshold)
+    # using the oldest set again makes the second oldest the one to go
+    read_all(conn, thresholds[0])
+    read_all(conn, thresholds[-1])
+    assert features.params_key(thresholds[0]) in stored_params(conn)
+    assert features.params_key(thresholds[1]) not in stored_params(conn)
+
+
+def test_rows_from_before_params_were_recorded_are_deleted():
+    conn = make_db()
+    read_all(conn, np.full((8, 8), 25.))
+    conn.execute('DELETE FROM features_params')
+    read_all(conn, np.full((8, 8), 26.))
+    assert stored_params(conn) == {features.params_key(np.full((8, 8), 26.))}
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from simulator import SimNode, synthetic_frames  # the Base Station modules import each other by name
+from xbee import FrameDecoder
+
+
+class FakeSerial:
+    # a serial port with data already waiting in its OS buffer
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size):
+        data, self.data = self.data[:size], self.data[size:]
+        return data
+
+
+def burst(count):
+    node = SimNode(1, synthetic_frames(10), 10., 900.)
+    return b''.join(node.data_packet() for _ in range(count))
+
+
+def test_burst_bigger_than_buffer_is_read_in_pieces():
+    ser = FakeSerial(burst(60))
+    decoder = FrameDecoder(ser)
+    frames = 0
+    while ser.in_waiting:
+        decoder.read()
+        frames += sum(1 for _ in decoder.frames())
+    assert frames == 60
+    assert decoder.stats()['dropped'] == 0
+
+
+def test_bytes_fed_past_the_buffer_are_counted():
+    data = burst(60)
+    decoder = FrameDecoder(None)
+    taken = decoder.feed(data)
+    assert taken == 4096
+    assert decoder.stats()['dropped'] == len(data) - 4096
@@ -0,0 +1,145 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Thermal background models
+#   Version:            1
+#
+#   Description:
+#       BackgroundModel keeps the thermal background of one node as numpy arrays: the slow moving
+#       background itself plus a running mean and sum of squared differences (Welford's method)
+#       used for the standard deviation of each pixel. BackgroundModels holds one model per node,
+#       loads them from the background table and writes back only the ones that changed.
+#       cached_threshold() keeps each node's threshold between analysis runs in the same process
+#       and only works it out again once the node's background row has been rewritten.
+#
+#   Dependencies:
+#       Python 3.5.1, sqlite3, numpy
+
+import datetime
+import numpy as np
+
+INACTIVE_RATE = 0.05  # weight of a new frame in the background when nobody is around
+ACTIVE_RATE = 0.01    # weight of a new frame when there is activity
+COLDEST = 5           # pixels used to scale the frame for an active update
+BACKGROUND_SELECT = 'SELECT Node, Datetime, Background, Sample, Mean, SumSqDif FROM background'
+
+THRESHOLDS = {}  # (node, multiplier) -> (Datetime of the background row, threshold)
+
+
+def parse_pixels(text):
+    # comma joined text from the background table to a numpy array
+    return np.array(text.split(','), dtype=np.float64)
+
+
+def join_pixels(values):
+    return ','.join(map(str, values.tolist()))
+
+
+class BackgroundModel:
+    def __init__(self, node, background, sample=1, mean=None, sum_sq_dif=None, updated=None):
+        self.node = node
+        self.background = np.array(background, dtype=np.float64).reshape(64)
+        self.sample = sample
+        self.mean = self.background.copy() if mean is None else np.array(mean, dtype=np.float64).reshape(64)
+        self.sum_sq_dif = np.zeros(64) if sum_sq_dif is None else np.array(sum_sq_dif, dtype=np.float64).reshape(64)
+        self.updated = updated
+        self.dirty = False
+
+    @classmethod
+    def from_row(cls, row):
+        # row is (Node, Datetime, Background, Sample, Mean, SumSqDif) from the background table
+        node, updated, background, sample, mean, sum_sq_dif = row
+        return cls(node, parse_pixels(background), sample or 1,
+                   None if mean is None else parse_pixels(mean),
+                   None if sum_sq_dif is None else parse_pixels(sum_sq_dif), updated)
+
+    def touch(self):
+        self.updated = datetime.datetime.now().strftime("%Y-%m-%dT%H:%M:%S:%f")
+        self.dirty = True
+
+    def inactive_update(self, frame):
+        # nobody is around: move the background towards the frame and add the frame to the statistics
+        frame = np.asarray(frame, dtype=np.float64).reshape(64)
+        self.background *= 1 - INACTIVE_RATE
+        self.background += INACTIVE_RATE * frame
+        self.sample += 1
+        delta1 = frame - self.mean
+        self.mean += delta1 / self.sample
+        self.sum_sq_dif += delta1 * (frame - self.mean)
+        self.touch()
+
+    def active_update(self, frame):
+        # there is activity: scale the frame so its coldest pixels match the background,
+        # then move the background slowly towards the scaled frame
+        frame = np.asarray(frame, dtype=np.float64).reshape(64)
+        coldest = np.argpartition(frame, COLDEST)[:COLDEST]
+        bg_scale = np.mean(self.background[coldest] / frame[coldest])
+        self.background *= 1 - ACTIVE_RATE
+        self.background += ACTIVE_RATE * bg_scale * frame
+        self.touch()
+
+    def std_dev(self):
+        # sample standard deviation of each pixel, sqrt(sum_sq_dif/(s-1))
+        return np.sqrt(self.sum_sq_dif / max(self.sample - 1, 1))
+
+    def threshold(self, multiplier):
+        # temperature a pixel has to be above to count as part of a hotspot, as an 8x8 array
+        return (self.background + multiplier * self.std_dev()).reshape((8, 8))
+
+    def row(self):
+        return (self.node, self.updated, join_pixels(self.background), self.sample,
+                join_pixels(self.mean), join_pixels(self.sum_sq_dif))
+
+
+class BackgroundModels(dict):
+    # BackgroundModel for each node, keyed by node id
+
+    @classmethod
+    def load(cls, conn):
+        models = cls()
+        for row in conn.execute(BACKGROUND_SELECT):
+            models[row[0]] = BackgroundModel.from_row(row)
+        return models
+
+    def inactive_update(self, node, frame):
+        if node in self:
+            self[node].inactive_update(frame)
+        else:
+            # the first frame from a node becomes its background
+            self[node] = BackgroundModel(node, frame)
+            self[node].touch()
+
+    def active_update(self, node, frame):
+        # returns False if the node doesn't have a background to update yet
+        if node not in self:
+            return False
+        self[node].active_update(frame)
+        return True
+
+    def save(self, writer):
+        # queue one row for every node that changed since the last save, writer is anything with
+        # an add(sql, row) method like storage.BatchWriter
+        for model in self.values():
+            if model.dirty:
+                writer.add("REPLACE INTO background"
+                           " (Node, Datetime, Background, Sample, Mean, SumSqDif)"
+                           " VALUES (?, ?, ?, ?, ?, ?)", model.row())
+                model.dirty = False
+
+
+def cached_threshold(conn, node, multiplier):
+    # BackgroundModels.load(conn)[node].threshold(multiplier), reusing the last one worked out for the node
+    # while its background row is unchanged (every update rewrites Datetime). KeyError if there's no row.
+    updated = conn.execute('SELECT Datetime FROM background WHERE Node = ?', (node,)).fetchone()
+    if updated is None:
+        raise KeyError(node)
+    cached = THRESHOLDS.get((node, multiplier))
+    if cached is None or cached[0] != updated[0]:
+        row = conn.execute(BACKGROUND_SELECT + ' WHERE Node = ?', (node,)).fetchone()
+        cached = THRESHOLDS[(node, multiplier)] = (row[1], BackgroundModel.from_row(row).threshold(multiplier))
+    return cached[1]
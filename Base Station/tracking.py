@@ -0,0 +1,301 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Streaming traffic tracker
+#   Version:            1
+#
+#   Description:
+#       The blob tracking from "traffic algorithm.py" as something frames can be fed into as they
+#       arrive, from the collector or a database cursor, one at a time or a chunk at a time.
+#       Each node is tracked separately. Only blobs that are still being followed are kept; a
+#       blob is handed back the frame it closes, and entries and exits are counted as that
+#       happens, so memory doesn't grow with the length of the range being analyzed.
+#
+#   Dependencies:
+#       Python 3.5.1, numpy, scipy
+
+from collections import deque
+import math
+from operator import add
+import numpy as np
+from scipy import optimize as op
+from hotspots import HotspotTable
+
+ENTER = 'enter'
+LEAVE = 'leave'
+
+
+GATE = 5        # furthest (in pixels) a hotspot can be from a blob's predicted location to be the same object
+HISTORY = 600   # per reading history kept for each blob (times, centers, ...), None keeps all of it
+EMA_TERMS = 18  # terms of the series RunningEma evaluates its weights with
+
+# PASCAL[j, i] is j choose i, TAYLOR[j] is the jth taylor coefficient of exp(-x)
+PASCAL = np.array([[math.factorial(j) // (math.factorial(i) * math.factorial(j - i)) if i <= j else 0
+                    for i in range(EMA_TERMS)] for j in range(EMA_TERMS)], dtype=float)
+TAYLOR = np.array([(-1) ** j / math.factorial(j) for j in range(EMA_TERMS)])
+
+
+class RunningEma:
+    # The exponential average the tracker has always used: n values weighted exp(-age / (n - 1)), so the
+    # newest counts 1 and the oldest exp(-1), normalized. The weights stretch as values are added, so
+    # instead of keeping every value this keeps sums[j] = sum(value * age ** j) and evaluates the weights
+    # with their taylor series, which comes to the same number (to rounding) in constant time and memory.
+    __slots__ = ('count', 'last', 'sums')
+
+    def __init__(self):
+        self.count = 0
+        self.last = 0.
+        self.sums = np.zeros(EMA_TERMS)
+
+    def add(self, value):
+        if self.count:
+            self.sums = PASCAL.dot(self.sums)  # everything already added gets one reading older
+        self.sums[0] += value
+        self.last = value
+        self.count += 1
+
+    def value(self, pad=0):
+        # average of the values added, as if pad zeros had been added before them
+        n = self.count + pad
+        if n == 0:
+            return float('nan')
+        if n == 1:
+            return float(self.last)
+        scale = (n - 1.) ** -np.arange(EMA_TERMS)
+        total = TAYLOR.dot(self.sums * scale)
+        weights = -math.expm1(-n / (n - 1.)) / -math.expm1(-1. / (n - 1.))
+        return float(total / weights)
+
+
+# this class is created for each found blob and stores various data values about each blob
+# it contains the functions of track movement over time
+class Region:
+    # the running values (readings, sizes, temperatures, displacement, averages) cover the whole track,
+    # the per reading history in times, data, center, bearing, velocity and prediction is capped at history
+    __slots__ = ('start_time', 'end_time', 'readings', 'times', 'data', 'size', 'max_s', 'min_s', 'avg_s',
+                 'prev_size', 'center', 'avg_temp', 'prev_temp', 'active', 'match',
+                 'displacement', 'duration', 'x_dis', 'y_dis', 'heading', 'bearing_sum', 'bearing', 'speed',
+                 'velocity', 'prediction')
+
+    def __init__(self, region, datetime, history=None):
+        # region is a row of a hotspots.HotspotTable
+        self.start_time = datetime
+        self.end_time = datetime
+        self.readings = 1
+        self.times = deque([datetime], history)
+        self.data = deque([(region['frame'], region['label'])], history)  # where to find the pixels of each reading
+        self.size = int(region['size'])
+        self.max_s = self.size
+        self.min_s = self.size
+        self.avg_s = self.size
+        self.prev_size = 0
+        self.center = deque([list(region['centroid'])], history)
+        self.avg_temp = region['temp']
+        self.prev_temp = self.avg_temp
+        self.active = True
+        self.match = False  # matched a hotspot this frame
+        self.displacement = 0
+        self.duration = 0
+        self.x_dis = 0
+        self.y_dis = 0
+        self.heading = 0.     # latest bearing
+        self.bearing_sum = 0.
+        self.bearing = deque([], history)  # bearing and velocity after each movement
+        self.speed = RunningEma()          # exponential average of the velocities
+        self.velocity = deque([], history)
+        self.prediction = deque([list(region['centroid'])], history)
+        # self.prediction = [[0, 0]]
+
+    # checks distance between two regions:
+    # pick 0 to find the euclidean distance
+    # pick 1 to find the separate x and y displacement
+    # pick 2 to find the euclidean distance between the new hotspot and the regions latest prediction
+
+    def check_distance(self, choice, region2):
+        if self.active:
+            cx, cy = region2['centroid']
+            if choice == 0:
+                # return math.sqrt((self.center[-1][0] - cx)**2 + (self.center[-1][1] - cy)**2)
+                return math.sqrt((cx - self.center[-1][0]) ** 2 + (cy - self.center[-1][1]) ** 2)
+
+            elif choice == 1:
+                # return cx - self.center[-1][0], self.center[-1][1] - cy
+                return cx - self.center[-1][0], cy - self.center[-1][1]
+
+            elif choice == 2:
+                return math.sqrt((cx - self.prediction[-1][0])**2
+                                 + (cy - self.prediction[-1][1])**2)
+        else:
+            return 16
+
+    def predict_movement(self):
+        # the velocity average starts from the 0 velocity of the first reading
+        step = self.speed.value(pad=1) / 2
+        pred = [0, 0]
+        pred[0] = self.center[-1][0] + step * np.cos(self.heading * np.pi / 180)
+        pred[1] = self.center[-1][1] + step * np.sin(self.heading * np.pi / 180)
+        # pred[0] = self.center[-1][0] + self.velocity[-1] * np.cos(self.heading * np.pi / 180)
+        # pred[1] = self.center[-1][1] + self.velocity[-1] * np.sin(self.heading * np.pi / 180)
+        # pred = list(np.clip(pred, 0, 7))
+        self.prediction.append(pred)
+
+    def avg_bearing(self):
+        return self.bearing_sum / (self.readings - 1) if self.readings > 1 else float('nan')
+
+    def avg_velocity(self):
+        return self.speed.value()
+
+    def check_movement(self, region2, datetime2):
+        # if -5 < self.center[-1][0] - cx < 5 and -5 < self.center[-1][1] - cy < 5 \
+        if self.check_distance(2, region2) < GATE and self.active and not self.match:
+            self.times.append(datetime2)
+            self.end_time = datetime2
+            self.duration = (self.end_time - self.start_time) / 1e6
+            self.data.append((region2['frame'], region2['label']))
+            self.readings += 1
+            self.prev_size = self.size
+            self.size = int(region2['size'])
+            if self.size > self.max_s:
+                self.max_s = self.size
+            if self.size < self.min_s:
+                self.min_s = self.size
+            self.avg_s = (self.avg_s * (self.readings - 1) + self.size) / self.readings
+            self.displacement += self.check_distance(0, region2)
+            velocity = self.displacement / self.duration
+            self.velocity.append(velocity)
+            self.speed.add(velocity)
+            self.x_dis, self.y_dis = map(add, [self.x_dis, self.y_dis], self.check_distance(1, region2))
+            self.heading = np.arctan2(self.y_dis, self.x_dis)*(180/np.pi)
+            self.bearing.append(self.heading)
+            self.bearing_sum += self.heading
+            self.center.append(list(region2['centroid']))
+            self.prev_temp = self.avg_temp
+            # self.avg_temp = np.mean([x[2] for x in self.data[-1]])
+            self.avg_temp = (self.prev_temp * (self.readings - 1) + region2['temp']) / self.readings
+            self.match = True
+            return True
+        else:
+            return False
+
+
+def direction(blob):
+    # ENTER or LEAVE for a finished blob that looks like someone walking through, otherwise None
+    if 2 < blob.readings < 10:
+        bearing = blob.avg_bearing()
+        if bearing > 0:
+            return LEAVE
+        if bearing < 0:
+            return ENTER
+    return None
+
+
+class NodeTracker:
+    # follows the blobs seen by one node, one frame of hotspots at a time. Only blobs still being followed
+    # are kept, so the work per frame depends on how many people are in view, not how long it's been running
+    def __init__(self, history=HISTORY):
+        self.blobs = []  # blobs still active
+        self.history = history
+
+    def update(self, time, spots):
+        # spots are the rows of a HotspotTable for the frame taken at time,
+        # returns the blobs that closed with this frame
+        rows, cols = self.assign(spots)
+        for i, j in zip(rows, cols):
+            self.blobs[i].check_movement(spots[j], time)
+
+        # blobs that didn't get a hotspot are finished, hotspots that didn't get a blob start new ones
+        following = set(rows)
+        closed = [a for i, a in enumerate(self.blobs) if i not in following]
+        self.blobs = [a for i, a in enumerate(self.blobs) if i in following]
+        for a in self.blobs:
+            a.match = False
+            a.predict_movement()
+        for a in closed:
+            a.active = False
+        taken = set(cols)
+        self.blobs.extend(Region(spots[j], time, self.history) for j in range(len(spots)) if j not in taken)
+        return closed
+
+    def assign(self, spots):
+        # pair blobs with the hotspots closest to their predicted locations, returns the blob and hotspot
+        # indexes of each pair. Pairs GATE or more apart can't be the same object and are left out.
+        if not self.blobs or not len(spots):
+            return (), ()
+        predicted = np.array([a.prediction[-1] for a in self.blobs])
+        dist = np.sqrt(((spots['centroid'][np.newaxis] - predicted[:, np.newaxis]) ** 2).sum(axis=2))
+        near = dist < GATE
+        rows = np.flatnonzero(near.any(axis=1))
+        cols = np.flatnonzero(near.any(axis=0))
+        if len(rows) <= 1 and len(cols) <= 1:
+            return rows.tolist(), cols.tolist()
+        # only blobs and hotspots with something in range go into the assignment, a pair out of range
+        # costs more than any set of pairs in range so as many blobs as possible get a hotspot
+        cost = dist[np.ix_(rows, cols)]
+        far = ~near[np.ix_(rows, cols)]
+        cost[far] = GATE * (min(len(rows), len(cols)) + 1)
+        i, j = op.linear_sum_assignment(cost)
+        keep = ~far[i, j]
+        return rows[i[keep]].tolist(), cols[j[keep]].tolist()
+
+    def close(self):
+        # end of the data, every blob still being followed is finished
+        closed, self.blobs = self.blobs, []
+        return closed
+
+
+class TrafficTracker:
+    # feed it (node, time, frame) as frames come in, time being the Epoch of the frame (microseconds), every blob that finished goes to sink(node, blob),
+    # or without a sink is returned as (node, blob)
+    def __init__(self, thresholds, history=HISTORY, sink=None):
+        self.thresholds = thresholds  # node -> 8x8 hotspot threshold
+        self.history = history        # per reading history kept for each blob
+        self.sink = sink
+        self.nodes = {}               # node -> NodeTracker
+        self.counts = {}              # node -> {ENTER: n, LEAVE: n}
+        self.skipped = 0              # frames from nodes without a threshold
+
+    def feed(self, node, time, frame):
+        return self.feed_frames(node, [time], np.asarray(frame).reshape((1, 8, 8)))
+
+    def feed_frames(self, node, times, frames):
+        # Epoch times and an (N, 8, 8) stack of frames from one node, in order
+        if node not in self.thresholds:
+            self.skipped += len(times)
+            return []
+        return self.feed_table(node, times, HotspotTable.from_frames(frames, self.thresholds[node]))
+
+    def feed_table(self, node, times, table):
+        # Epoch times and the HotspotTable of the frames taken at those times with the node's threshold,
+        # for hotspots that were found already (see features.read_features())
+        if node not in self.thresholds:
+            self.skipped += len(times)
+            return []
+        tracker = self.nodes.get(node)
+        if tracker is None:
+            tracker = self.nodes[node] = NodeTracker(self.history)
+        finished = []
+        for time, spots in zip(times, table.frames()):
+            finished.extend(self.finish(node, tracker.update(time, spots)))
+        return finished
+
+    def close(self):
+        # finish every blob still being followed, for when the data runs out
+        finished = []
+        for node, tracker in self.nodes.items():
+            finished.extend(self.finish(node, tracker.close()))
+        return finished
+
+    def finish(self, node, blobs):
+        counts = self.counts.setdefault(node, {ENTER: 0, LEAVE: 0})
+        for blob in blobs:
+            way = direction(blob)
+            if way is not None:
+                counts[way] += 1
+            if self.sink is not None:
+                self.sink(node, blob)
+        return [] if self.sink is not None else [(node, blob) for blob in blobs]
@@ -0,0 +1,153 @@
+# ---------------------------------------------------------------------------------------------
+#
+#   University of North Texas
+#   Department of Electrical Engineering
+#
+#   Faculty Advisors:   Dr. Xinrong Li, Dr. Jesse Hamner, Dr. Song Fu
+#   Name:               Ovie Onoriose
+#
+#   Title:              Xbee API frame helpers
+#   Version:            1
+#
+#   Description:
+#       Helpers for talking to the Xbee coordinator in API mode. FrameDecoder pulls
+#       whatever bytes the serial port has waiting into one reusable buffer and hands
+#       back complete, checksum verified frames without reading a byte at a time. A read only
+#       takes as much as the buffer has room for, a burst bigger than that stays in the port
+#       until the frames already read have been handed back.
+#
+#   Dependencies:
+#       Python 3.5.1, Pyserial
+
+START_DELIMITER = 0x7E
+RX_PACKET = 0x90            # zigbee receive packet (sensor data and background updates)
+REMOTE_AT_RESPONSE = 0x97   # remote AT command response (node discovery replies)
+REMOTE_AT_REQUEST = 0x17    # remote AT command request (data requests and discovery)
+MAX_FRAME = 256             # largest frame we expect from a node, anything bigger is garbage
+
+BROADCAST = bytes([0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0xFF, 0xFF])
+SERIAL_HIGH = bytes([0x00, 0x13, 0xA2, 0x00])  # upper half of every Xbee's 64 bit address
+APPLY_CHANGES = 0x02  # remote AT option, apply the change right away
+
+
+def find_checksum(packet):  # find checksums of Xbee packets
+    total = 0
+    for i in range(3, len(packet)):
+        total += packet[i]
+    return 0xFF - (0xFF & total)
+
+
+def api_frame(frame_data):
+    # wrap frame data (frame type onwards) with the start delimiter, length and checksum
+    packet = [START_DELIMITER, len(frame_data) >> 8, len(frame_data) & 0xFF] + list(frame_data)
+    packet.append(find_checksum(packet))
+    return bytes(packet)
+
+
+def remote_at(address, command, parameter=b'', frame_id=0):
+    # remote AT command to the Xbee with the given 64 bit address. With a frame id other than 0 the
+    # coordinator answers with a REMOTE_AT_RESPONSE carrying the same frame id and a status byte
+    return api_frame([REMOTE_AT_REQUEST, frame_id] + list(address) + [0xFF, 0xFE, APPLY_CHANGES] +
+                     list(command) + list(parameter))
+
+
+class FrameDecoder:
+    # Streaming decoder for Xbee API frames
+    # read() drains the serial port in bulk into a fixed buffer, frames() yields each complete frame
+    # as a memoryview of the frame data (frame type byte through the last byte before the checksum).
+    # Yielded views point into the decoder's buffer so they are only valid until the next read()
+
+    def __init__(self, ser, frame_types=(RX_PACKET, REMOTE_AT_RESPONSE), size=4096):
+        self.ser = ser
+        self.frame_types = frozenset(frame_types)
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0  # first byte not yet parsed
+        self.end = 0    # one past the last byte received
+
+        # counters instead of printing every bad frame
+        self.received = 0   # good frames handed back
+        self.invalid = 0    # bad checksum or impossible length
+        self.truncated = 0  # frame cut off by a timeout or flush
+        self.skipped = 0    # good frames of a type we don't care about
+        self.garbage = 0    # bytes thrown away while looking for a start delimiter
+        self.dropped = 0    # bytes fed with no room left in the buffer
+
+    def reset(self):
+        # throw away anything buffered, e.g. after the serial port has been flushed
+        if self.end > self.start:
+            self.truncated += 1
+        self.start = self.end = 0
+
+    def space(self):
+        # bytes that can be fed without losing any, after moving what's still pending to the front
+        if self.start:
+            pending = self.end - self.start
+            self.buf[:pending] = self.buf[self.start:self.end]
+            self.start, self.end = 0, pending
+        return len(self.buf) - self.end
+
+    def feed(self, data):
+        # append raw bytes to the buffer and return how many were taken. Only space() bytes fit until
+        # frames() has used up the complete frames, anything past that is counted in dropped
+        n = min(len(data), self.space())
+        self.dropped += len(data) - n
+        self.buf[self.end:self.end + n] = data[:n]
+        self.end += n
+        return n
+
+    def read(self):
+        # block for up to the serial timeout for the first byte, then take everything else waiting that
+        # fits, the rest stays in the port's buffer for the next read after frames()
+        # returns the number of bytes read (0 on a timeout)
+        # a partial frame is kept across a timeout, call reset() if the rest is never coming
+        space = self.space()
+        if not space:
+            # frames() wasn't run since the last read, or the buffer is all one partial frame
+            self.reset()
+            space = len(self.buf)
+        data = self.ser.read(max(1, min(self.ser.in_waiting, space)))
+        if not data:
+            return 0
+        self.feed(data)
+        return len(data)
+
+    def frames(self):
+        buf = self.buf
+        while True:
+            # resync on the next start delimiter
+            idx = buf.find(START_DELIMITER, self.start, self.end)
+            if idx < 0:
+                self.garbage += self.end - self.start
+                self.start = self.end = 0
+                return
+            self.garbage += idx - self.start
+            self.start = idx
+
+            if self.end - idx < 3:
+                return  # length not here yet
+            length = (buf[idx + 1] << 8) | buf[idx + 2]
+            if length == 0 or length > MAX_FRAME:
+                # not a real frame, skip this delimiter and keep looking
+                self.invalid += 1
+                self.start = idx + 1
+                continue
+            if self.end - idx < length + 4:
+                return  # rest of the frame not here yet
+
+            frame = self.view[idx + 3:idx + 3 + length]
+            if (sum(frame) + buf[idx + 3 + length]) & 0xFF != 0xFF:
+                self.invalid += 1
+                self.start = idx + 1
+                continue
+
+            self.start = idx + length + 4
+            if frame[0] in self.frame_types:
+                self.received += 1
+                yield frame
+            else:
+                self.skipped += 1
+
+    def stats(self):
+        return {'received': self.received, 'invalid': self.invalid, 'truncated': self.truncated,
+                'skipped': self.skipped, 'garbage': self.garbage, 'dropped': self.dropped}